@@ -2,31 +2,86 @@
 
 import argparse
 import copy
+import errno
+import fcntl
 import fnmatch
 import hashlib
+import httplib
 import json
 import os
 import re
 import shutil
+import subprocess
 import sys
 import tempfile
-import urllib2
+import threading
+import time
+import urllib
 import urlparse
 
+import http_session
+
+from distutils.spawn import find_executable
 from itertools import chain
 
 
-def md5Hash(filePath):
-    if not os.path.exists(filePath):
-        raise Exception("file does not exist: %s" % filePath)
-    md5 = hashlib.md5()
-    with open(filePath, "rb") as f:
-        bytes = f.read(4096)
-        while bytes:
-            md5.update(bytes)
-            bytes = f.read(4096)
+# Downloads are streamed to disk in chunks of this size.
+CHUNK_SIZE = 1024 * 1024
+
+# Maps the checksum names used by the zenpacks requirement endpoint to
+# the hashlib algorithm that produces them.
+CHECKSUM_FIELDS = {
+    "md5sum": "md5",
+    "shasum": "sha1",
+}
+
+
+def _defaultFileMode():
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0666 & ~umask
+
+
+# Archives that can be unpacked while they download, by file name suffix,
+# with the decompressors tar may use for them, fastest first.  None means
+# tar reads the archive itself.
+ARCHIVE_FORMATS = [
+    ((".tar.gz", ".tgz"), ["pigz", "gzip"]),
+    ((".tar.bz2", ".tbz2"), ["lbzip2", "pbzip2", "bzip2"]),
+    ((".tar.xz", ".txz"), ["xz"]),
+    ((".tar",), None),
+]
+
+# tempfile.mkstemp() always creates 0600 files; downloads should get the
+# same mode a plain open() would have given them.
+DEFAULT_FILE_MODE = _defaultFileMode()
+
+# The shared artifact cache, or None when --cache-dir is not given.
+artifactCache = None
 
-    return md5.hexdigest()
+# HTTP client shared by every download; main() applies --timeout/--retries.
+httpSession = http_session.Session()
+
+# Serialises output, so the lines printed by concurrent downloads do not
+# run together in the build log.
+outputLock = threading.Lock()
+
+
+def printLine(line):
+    """Print line in one piece, even from a download thread."""
+    with outputLock:
+        sys.stdout.write("%s\n" % line)
+        sys.stdout.flush()
+
+
+# Maps artifact names to the (directory, strip) they are unpacked into as
+# they download; main() fills it from --extract.  downloadArtifacts() adds
+# the Event of the archive that has to be unpacked into the directory first.
+extractTargets = {}
+
+# Maps artifact names to an Event set once their download, and with it the
+# unpacking of their archive, is over.
+extractionDone = {}
 
 
 def zenpackDownload(versionInfo, outdir, downloadReport):
@@ -39,8 +94,6 @@ def zenpackDownload(versionInfo, outdir, downloadReport):
     README.versionInfo.md
 
     """
-    endpoint = "http://zenpacks.zenoss.eng/requirement"
-
     # artifactInfo gets published to downloadReport. Copy versionInfo
     # into it, and specify any defaults. This ensures that all
     # information about what was requested from the endpoint gets
@@ -50,17 +103,8 @@ def zenpackDownload(versionInfo, outdir, downloadReport):
     artifactInfo.setdefault("feature", None)
     artifactInfo.setdefault("pre", False)
 
-    requirement = urllib2.quote(artifactInfo["requirement"])
-    feature = urllib2.quote(artifactInfo["feature"] or "")
-    pre = bool(artifactInfo["pre"])
-
-    # <endpoint>/<requirement>[/<feature>][?pre]
-    url = "".join((
-        endpoint,
-        "/{}".format(requirement),
-        "/{}".format(feature) if feature else "",
-        "?pre" if pre else ""
-    ))
+    url = zenpackResolver.requirementURL(
+        artifactInfo["requirement"], artifactInfo["feature"], artifactInfo["pre"])
 
     # Find best ZenPack match based on requirements.
     #
@@ -87,8 +131,8 @@ def zenpackDownload(versionInfo, outdir, downloadReport):
     #       "version": "1.0.0.dev2+g0abcdef"
     #   }
     try:
-        zenpack = json.loads(urllib2.urlopen(url).read())
-    except urllib2.HTTPError as e:
+        zenpack = zenpackResolver.resolve(url, ZenPackInfo(versionInfo).cacheable)
+    except http_session.HTTPError as e:
         artifactInfo["zenpack"] = {
             "url": e.url,
             "code": e.code,
@@ -97,7 +141,7 @@ def zenpackDownload(versionInfo, outdir, downloadReport):
 
         downloadReport.append(artifactInfo)
         raise Exception("Error querying for ZP info from %s: %s" % (url, e))
-    except urllib2.URLError as e:
+    except http_session.ConnectionError as e:
         artifactInfo["zenpack"] = {
             "error": str(e),
         }
@@ -124,50 +168,333 @@ def zenpackDownload(versionInfo, outdir, downloadReport):
                 .format(versionInfo["name"]))
 
     downloadReport.append(artifactInfo)
-    downloadArtifact(zenpack["url"], outdir)
+    checksums = dict((field, zenpack.get(field)) for field in CHECKSUM_FIELDS)
+    downloadArtifact(zenpack["url"], outdir, checksums, extractTargets.get(versionInfo["name"]))
+    return artifactPath(zenpack["url"], outdir)
 
 
 def urlDownload(versionInfo, outdir, downloadReport):
     info = URLDownloadInfo(versionInfo)
     url = info.url
-    print url
+    printLine(url)
     parsed = urlparse.urlparse(url)
     if not parsed.scheme or not parsed.netloc or not parsed.path:
         raise Exception("Unable to download file(s) for aritfact %s: invalid URL: %s" % (info.name, url))
 
-    downloadArtifact(url, outdir)
+    # Pinned URLs never change content, so the checksums recorded the first
+    # time they were downloaded let the cache serve them without a request.
+    checksums = None
+    if artifactCache and info.pinned:
+        checksums = artifactCache.checksums(url)
+    downloadArtifact(url, outdir, checksums, extractTargets.get(info.name))
 
     artifactInfo = info.toDict()
     artifactInfo['type'] = 'releasedArtifact'
     downloadReport.append(artifactInfo)
+    return artifactPath(url, outdir)
+
+
+def validatorsPath(path):
+    """Return the hidden file holding the HTTP validators for path."""
+    return os.path.join(os.path.dirname(path), ".%s.http.json" % os.path.basename(path))
+
+
+def readValidators(path, url, checksums=None):
+    """Return the validators saved when url was downloaded to path.
+
+    Returns None unless path still holds the content described by them:
+    same URL, same size and, when given, the expected checksums.
+    """
+    try:
+        with open(validatorsPath(path)) as f:
+            validators = json.load(f)
+        size = os.path.getsize(path)
+    except (IOError, OSError, ValueError):
+        return None
+    if validators.get("url") != url or validators.get("size") != size:
+        return None
+    for field, expected in (checksums or {}).iteritems():
+        if expected and validators.get(field) != expected.lower():
+            return None
+    return validators
+
+
+def writeValidators(path, url, progress, digests):
+    validators = {
+        "url": url,
+        "etag": progress["etag"],
+        "last_modified": progress["last_modified"],
+        "size": progress["size"],
+    }
+    validators.update(digests)
+    with open(validatorsPath(path), "w") as f:
+        json.dump(validators, f, indent=4, sort_keys=True, separators=(',', ': '))
+
+
+def discardValidators(path):
+    try:
+        os.unlink(validatorsPath(path))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def artifactPath(url, outdir):
+    """Return the path downloadArtifact() saves url to."""
+    return os.path.join(outdir, os.path.basename(url))
 
 
 #
 # NOTE: Caller is responsible for validating basic URL syntax
-def downloadArtifact(url, outdir):
-    print("Downloading %s" % url)
-    response = urllib2.urlopen(url)
-    finalDestination = (os.path.join(outdir, os.path.basename(url)))
-    downloadDestination = finalDestination
-    sig = None
+def downloadArtifact(url, outdir, checksums=None, extract=None):
+    """Stream url into outdir, hashing the body while it is written.
+
+    checksums optionally maps the "md5sum"/"shasum" fields returned by the
+    zenpacks requirement endpoint to their expected values; a mismatch
+    discards the download and raises.  The body is written to a hidden
+    .part file in outdir which is then renamed over the destination, so
+    an existing copy is replaced atomically without being read.
+
+    An interrupted transfer keeps its .part file and the byte offset
+    reached, and is resumed with a Range request, both by the retries
+    here and by a later run.  The checksums always cover the whole file.
+
+    When the artifact cache already holds content with the expected
+    "shasum" it is linked into outdir and no request is made; anything
+    that is downloaded is added to the cache.
+
+    The ETag and Last-Modified headers of each download are saved beside
+    the file, and a later download of the same URL sends them back as a
+    conditional request; a 304 response keeps the existing file.
+
+    extract optionally gives the (directory, strip) to unpack the artifact
+    into; the body is piped to tar as it arrives, see Extractor.
+
+    Returns a dict with the "md5sum" and "shasum" of the downloaded file.
+    """
+    finalDestination = artifactPath(url, outdir)
+    extractor = Extractor(finalDestination, *extract) if extract else None
+    try:
+        digests = fetchArtifact(url, finalDestination, checksums, extractor)
+        if extractor:
+            # Cached and unmodified files have not been through tar yet.
+            extractor.finish(finalDestination)
+    except BaseException:
+        if extractor:
+            extractor.abort()
+        raise
+    return digests
+
+
+def fetchArtifact(url, finalDestination, checksums, extractor):
+    """Download url to finalDestination; see downloadArtifact()."""
+    shasum = (checksums or {}).get("shasum")
+    if artifactCache and shasum and artifactCache.install(shasum, finalDestination):
+        printLine("Using cached artifact %s for %s" % (finalDestination, url))
+        discardValidators(finalDestination)
+        return dict(checksums)
+
+    headers = {}
+    validators = readValidators(finalDestination, url, checksums)
+    if validators:
+        if validators["etag"]:
+            headers["If-None-Match"] = validators["etag"]
+        if validators["last_modified"]:
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    printLine("Downloading %s" % url)
+    attempt = 0
+    while True:
+        progress = readProgress(finalDestination, url)
+        try:
+            result = fetchPartial(url, finalDestination, headers, progress, extractor)
+            break
+        except (IOError, httplib.HTTPException) as e:
+            # http_session has already retried failures to connect; these
+            # are transfers that broke off part way through the body.
+            if attempt >= httpSession.retries:
+                raise
+            attempt += 1
+            printLine("Download of %s interrupted (%s), resuming" % (url, e))
+            time.sleep(httpSession.backoff * 2 ** (attempt - 1))
+
+    if result is None:
+        printLine("Not modified, keeping %s" % finalDestination)
+        digests = dict((field, validators[field]) for field in CHECKSUM_FIELDS)
+        if artifactCache:
+            artifactCache.add(url, finalDestination, digests)
+        return digests
+
+    digests, progress = result
+    partPath, _ = partialPaths(finalDestination)
+    for field, expected in (checksums or {}).iteritems():
+        if expected and field in digests and digests[field] != expected.lower():
+            discardPartial(finalDestination)
+            raise Exception("Checksum mismatch for %s: %s is %s, expected %s" % (
+                url, field, digests[field], expected))
+
     if os.path.exists(finalDestination):
-        print "existing found, computing hash: %s" % finalDestination
-        tmpFile = tempfile.NamedTemporaryFile()
-        downloadDestination = tmpFile.name
-        sig = md5Hash(finalDestination)
+        printLine("Replacing file: %s" % finalDestination)
+    discardValidators(finalDestination)
+    os.rename(partPath, finalDestination)
+    discardPartial(finalDestination)
+    writeValidators(finalDestination, url, progress, digests)
+
+    if artifactCache:
+        artifactCache.add(url, finalDestination, digests)
+
+    return digests
 
-    with open(downloadDestination, "wb") as local_file:
-        print "Saving artifact to %s" % downloadDestination
-        local_file.write(response.read())
 
-    # check if we detected a file already
-    if sig:
-        # get md5 of downloaded file to compare to
-        newSig = md5Hash(downloadDestination)
-        print sig
-        if newSig != sig:
-            print("Replacing file: %s" % finalDestination)
-            shutil.copy(downloadDestination, finalDestination)
+def partialPaths(path):
+    """Return the hidden .part file for path and its progress record."""
+    partPath = os.path.join(os.path.dirname(path), ".%s.part" % os.path.basename(path))
+    return partPath, partPath + ".json"
+
+
+def readProgress(path, url):
+    """Return the progress record of an interrupted download of url to path.
+
+    The record's "offset" is the number of bytes of the .part file known
+    to have been written; bytes after it are discarded on resume.
+    """
+    partPath, progressPath = partialPaths(path)
+    try:
+        with open(progressPath) as f:
+            progress = json.load(f)
+        size = os.path.getsize(partPath)
+    except (IOError, OSError, ValueError):
+        return None
+    if progress.get("url") != url:
+        return None
+    progress["offset"] = min(progress.get("offset", 0), size)
+    return progress
+
+
+def writeProgress(path, progress):
+    _, progressPath = partialPaths(path)
+    tmpPath = privateTempPath(progressPath)
+    with open(tmpPath, "w") as f:
+        json.dump(progress, f, sort_keys=True)
+    os.rename(tmpPath, progressPath)
+
+
+def discardPartial(path):
+    for partialPath in partialPaths(path):
+        try:
+            os.unlink(partialPath)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+def fetchPartial(url, path, headers, progress, extractor=None):
+    """Download url into the .part file of path, resuming from progress.
+
+    Every byte of the file, including those kept from an earlier attempt,
+    is also passed to extractor when one is given.
+
+    Returns None if the server answered 304 Not Modified, otherwise the
+    digests of the complete .part file and its final progress record.
+    """
+    partPath, _ = partialPaths(path)
+    requestHeaders = headers
+    if progress and progress["offset"]:
+        # A resumed transfer must continue the same content, so If-Range
+        # makes the server send the whole body again if it has changed.
+        requestHeaders = {"Range": "bytes=%d-" % progress["offset"]}
+        validator = progress.get("etag") or progress.get("last_modified")
+        if validator:
+            requestHeaders["If-Range"] = validator
+
+    try:
+        response = httpSession.open(url, requestHeaders)
+    except http_session.HTTPError as e:
+        # 416 means the .part file is already as long as the artifact, or
+        # longer, so there is nothing left to resume.
+        if e.code != 416 or requestHeaders is headers:
+            raise
+        return restartPartial(url, path, headers, extractor, e)
+    try:
+        if response.code == 304:
+            response.read()
+            return None
+
+        hashes = dict((field, hashlib.new(algorithm)) for field, algorithm in CHECKSUM_FIELDS.iteritems())
+        offset = 0
+        if response.code == 206:
+            contentRange = response.getheader("Content-Range", "")
+            match = re.match(r"bytes (\d+)-\d*/(\d+|\*)", contentRange)
+            if not match or int(match.group(1)) != progress["offset"]:
+                discardPartial(path)
+                raise httplib.HTTPException("unexpected Content-Range %r" % contentRange)
+            # Without an ETag, If-Range may not have caught a change to
+            # the artifact, but a change of size is caught here.
+            length = progress.get("length")
+            if not progress.get("etag") and length is not None and match.group(2) not in ("*", str(length)):
+                response.close()
+                return restartPartial(url, path, headers, extractor, "size changed from %d to %s bytes" % (
+                    length, match.group(2)))
+            offset = progress["offset"]
+        else:
+            if extractor:
+                # The body starts over, and so must tar.
+                extractor.restart()
+            length = response.getheader("Content-Length")
+            progress = {
+                "url": url,
+                "etag": response.getheader("ETag"),
+                "last_modified": response.getheader("Last-Modified"),
+                "length": int(length) if length is not None else None,
+            }
+
+        with open(partPath, "r+b" if offset else "wb") as local_file:
+            # Hash the bytes kept from the earlier attempt, then append.
+            remaining = offset
+            while remaining:
+                chunk = local_file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                for h in hashes.itervalues():
+                    h.update(chunk)
+                if extractor:
+                    extractor.write(offset - remaining, chunk)
+                remaining -= len(chunk)
+            local_file.truncate(offset)
+            local_file.seek(offset)
+            printLine("Saving artifact to %s%s" % (path, " from byte %d" % offset if offset else ""))
+
+            expectedSize = response.getheader("Content-Length")
+            if expectedSize is not None:
+                expectedSize = offset + int(expectedSize)
+            try:
+                chunk = response.read(CHUNK_SIZE)
+                while chunk:
+                    for h in hashes.itervalues():
+                        h.update(chunk)
+                    local_file.write(chunk)
+                    if extractor:
+                        extractor.write(offset, chunk)
+                    offset += len(chunk)
+                    chunk = response.read(CHUNK_SIZE)
+                if expectedSize is not None and offset != expectedSize:
+                    raise httplib.IncompleteRead("", expectedSize - offset)
+            finally:
+                local_file.flush()
+                progress["offset"] = offset
+                writeProgress(path, progress)
+    finally:
+        response.close()
+
+    progress["size"] = offset
+    return dict((field, h.hexdigest()) for field, h in hashes.iteritems()), progress
+
+
+def restartPartial(url, path, headers, extractor, reason):
+    """Discard the .part file of path and download url from byte 0."""
+    printLine("Cannot resume download of %s (%s), starting over" % (url, reason))
+    discardPartial(path)
+    return fetchPartial(url, path, headers, None, extractor)
 
 
 def jenkinsDownload(versionInfo, outdir, downloadReport):
@@ -176,39 +503,26 @@ def jenkinsDownload(versionInfo, outdir, downloadReport):
 
     job = jenkinsInfo.job
     server = jenkinsInfo.server
-    baseURL = "%s/lastSuccessfulBuild" % jenkinsInfo.jobURL
-    queryURL = "%s/api/json?tree=artifacts[*],number,actions[lastBuiltRevision[*,branch[*]]]" % baseURL
-    parsed = urlparse.urlparse(queryURL)
+    parsed = urlparse.urlparse(jenkinsInfo.jobURL)
     if not parsed.scheme or not parsed.netloc or not parsed.path:
-        raise Exception("Unable to download file(s) for aritfact %s: invalid URL: %s" % (artifactName, queryURL))
+        raise Exception("Unable to download file(s) for aritfact %s: invalid URL: %s" % (artifactName, jenkinsInfo.jobURL))
 
-    try:
-        response = json.loads(urllib2.urlopen(queryURL).read())
-    except urllib2.URLError as e:
-        raise Exception("Error downloading %s: %s" % (queryURL, e))
-    except urllib2.HTTPError as e:
-        raise Exception("Error downloading %s: %s" % (queryURL, e))
-    except httplib.HTTPException, e:
-        raise Exception("Error downloading %s: %s" % (queryURL, e))
+    response = jenkinsMetadata.lastSuccessfulBuild(jenkinsInfo.jobURL)
+    number = response['number']
 
+    # Download from the build by number, so every file and the report
+    # describe the same build even if another one finishes meanwhile.
+    baseURL = "%s/%d" % (jenkinsInfo.jobURL, number)
 
     #
     # If the artifact has a subModule in Jenkins, then we need to query a different URL to get the subModule's artifacts
     #
     if jenkinsInfo.subModule:
         baseURL = "%s/%s" % (baseURL, jenkinsInfo.subModule)
-        artifactsURL = "%s/api/json?tree=artifacts[*]" % baseURL
-        parsed = urlparse.urlparse(artifactsURL)
-        if not parsed.scheme or not parsed.netloc or not parsed.path:
-            raise Exception(
-                "Unable to download file(s) for aritfact %s: invalid URL: %s" % (artifactName, artifactsURL))
-
-        artifactsResponse = json.loads(urllib2.urlopen(artifactsURL).read())
-        artifacts = artifactsResponse['artifacts']
+        artifacts = jenkinsMetadata.subModuleArtifacts(jenkinsInfo.jobURL, number, jenkinsInfo.subModule)
     else:
         artifacts = response['artifacts']
 
-    number = response['number']
     if len(artifacts) == 0:
         raise Exception("No artifacts available for lastSuccessfulBuild of %s (see job %s #%d on Jenkins server %s)" % (
             artifactName, job, number, server))
@@ -223,40 +537,44 @@ def jenkinsDownload(versionInfo, outdir, downloadReport):
     else:
         git_ref = git_branch = None
 
-    # Secondly, loop through the list of build artifacts and download any that match the specified pattern
-    nDownloaded = 0
-    for artifact in artifacts:
-        fileName = artifact['fileName']
-        for pattern in jenkinsInfo.patterns:
-            if fnmatch.fnmatch(fileName, pattern):
-                print ("Found artifact %s for lastSuccessfulBuild of %s (see job %s #%d on Jenkins server %s)" % (
-                    fileName, artifactName, job, number, server))
-                relativePath = artifact['relativePath']
-                downloadURL = "%s/artifact/%s" % (baseURL, relativePath)
-                downloadArtifact(downloadURL, outdir)
-                nDownloaded += 1
-                #
-                # TODOs:
-                # 1. Add changelog info
-                #
-                artifactInfo = jenkinsInfo.toDict()
-                if git_ref:
-                    artifactInfo['git_ref'] = git_ref
-                    artifactInfo['git_ref_url'] = jenkinsInfo.gitRepo.replace('.git', '/tree/%s' % git_ref)
-                    artifactInfo['git_branch'] = git_branch
-                artifactInfo['jenkins.job_nbr'] = number
-                artifactInfo['jenkins.artifact'] = fileName
-                downloadReport.append(artifactInfo)
-
-    if nDownloaded == 0:
+    # Secondly, find the build artifacts that match the specified patterns
+    matcher = jenkinsInfo.matcher
+    matches = [artifact for artifact in artifacts if matcher.match(artifact['fileName'])]
+    if not matches:
         raise Exception(
             "No artifacts downloaded from lastSuccessfulBuild of %s (see job %s #%d on Jenkins server %s)" % (
                 artifactName, job, number, server))
-    if nDownloaded > 1:
+    if len(matches) > 1:
         raise Exception("Download pattern is ambiguous, more than one artifact matched")
 
+    artifact = matches[0]
+    fileName = artifact['fileName']
+    printLine("Found artifact %s for lastSuccessfulBuild of %s (see job %s #%d on Jenkins server %s)" % (
+        fileName, artifactName, job, number, server))
+    relativePath = artifact['relativePath']
+    downloadURL = "%s/artifact/%s" % (baseURL, relativePath)
+    # The URL names a finished build, so its content can never change.
+    checksums = None
+    if artifactCache:
+        checksums = artifactCache.checksums(downloadURL)
+    downloadArtifact(downloadURL, outdir, checksums, extractTargets.get(artifactName))
+    #
+    # TODOs:
+    # 1. Add changelog info
+    #
+    artifactInfo = jenkinsInfo.toDict()
+    if git_ref:
+        artifactInfo['git_ref'] = git_ref
+        artifactInfo['git_ref_url'] = jenkinsInfo.gitRepo.replace('.git', '/tree/%s' % git_ref)
+        artifactInfo['git_branch'] = git_branch
+    artifactInfo['jenkins.job_nbr'] = number
+    artifactInfo['jenkins.artifact'] = fileName
+    downloadReport.append(artifactInfo)
+    return artifactPath(downloadURL, outdir)
+
 
-# downloaders is a dictionary of "type" to function that can
+# downloaders is a dictionary of "type" to function that can download the
+# artifact described by a versionInfo dict; each returns the downloaded file.
 downloaders = {
     "download": urlDownload,
     "jenkins": jenkinsDownload,
@@ -264,7 +582,14 @@ downloaders = {
 }
 
 
-def downloadArtifacts(versionsFile, artifacts, downloadDir, downloadReport):
+def downloadArtifacts(versionsFile, artifacts, downloadDir, downloadReport, jobs=1):
+    """Download artifacts and return the plan of what was downloaded.
+
+    The plan has one entry per artifact, in the order requested, with its
+    "name", "type" and the "path" of the downloaded file.  Artifacts that
+    were unpacked with --extract also have the "extracted_to" directory
+    and the "manifest" listing the extracted files.
+    """
     versions = json.load(versionsFile)
     versionsMap = {}
     for version in versions:
@@ -273,6 +598,9 @@ def downloadArtifacts(versionsFile, artifacts, downloadDir, downloadReport):
     if not os.path.isdir(downloadDir):
         raise Exception("Path is not a directory: %s" % downloadDir)
 
+    # Validate every requested artifact before starting any download, so a
+    # bad name at the end of a long list does not fail after the transfers.
+    tasks = []
     for artifactName in artifacts:
         if artifactName not in versionsMap:
             raise Exception("Artifact version information not found: %s" % artifactName)
@@ -280,40 +608,114 @@ def downloadArtifacts(versionsFile, artifacts, downloadDir, downloadReport):
         if versionInfo['type'] not in downloaders:
             raise Exception(
                 "Cannot not download artifact, unknown download type: %s %s" % (artifactName, versionInfo['type']))
-        downloaders[versionInfo['type']](versionInfo, downloadDir, downloadReport)
+        tasks.append(versionInfo)
+
+    # Archives unpacked into the same directory are unpacked one after the
+    # other, in the order of tasks, so that a file shipped in more than one
+    # of them always comes from the same archive.  Tasks start in order, so
+    # the archive one waits for has always started downloading.
+    previous = {}
+    for versionInfo in tasks:
+        name = versionInfo['name']
+        if name in extractTargets:
+            directory, strip = extractTargets[name][:2]
+            extractionDone[name] = threading.Event()
+            extractTargets[name] = (directory, strip, previous.get(os.path.abspath(directory)))
+            previous[os.path.abspath(directory)] = extractionDone[name]
+
+    # Resolve all ZenPack requirements in one concurrent pass, so the
+    # downloaders below only look up results the resolver already has.
+    zenpackResolver.resolveAll(
+        [zenpackResolver.query(versionInfo) for versionInfo in tasks if versionInfo['type'] == 'zenpack'],
+        jobs)
+
+    if jobs <= 1 or len(tasks) <= 1:
+        paths = [runDownloader(versionInfo, downloadDir, downloadReport)
+                 for versionInfo in tasks]
+    else:
+        reports, paths = downloadConcurrently(tasks, downloadDir, jobs)
+        for report in reports:
+            downloadReport.extend(report)
+
+    plan = []
+    for versionInfo, path in zip(tasks, paths):
+        entry = {"name": versionInfo['name'], "type": versionInfo['type'], "path": os.path.abspath(path)}
+        if versionInfo['name'] in extractTargets:
+            entry["extracted_to"] = os.path.abspath(extractTargets[versionInfo['name']][0])
+            entry["manifest"] = os.path.abspath(manifestPath(path))
+        plan.append(entry)
+    return plan
+
+
+def runDownloader(versionInfo, downloadDir, downloadReport):
+    """Run the downloader of versionInfo, then let the next archive to be
+    unpacked into the same directory be unpacked, even if this one failed."""
+    try:
+        return downloaders[versionInfo['type']](versionInfo, downloadDir, downloadReport)
+    finally:
+        if versionInfo['name'] in extractionDone:
+            extractionDone[versionInfo['name']].set()
+
+
+def downloadConcurrently(tasks, downloadDir, jobs):
+    """Run the downloaders for tasks on a pool of at most jobs threads.
+
+    Returns one report list and one downloaded path per task, in the same
+    order as tasks, so the caller's downloadReport does not depend on which
+    download finished first.  The first failure stops any task that has not started yet and
+    is re-raised once the downloads already in flight have finished.
+    """
+    reports = [[] for _ in tasks]
+    paths = http_session.runConcurrently(
+        [lambda versionInfo=versionInfo, report=report:
+            runDownloader(versionInfo, downloadDir, report)
+         for versionInfo, report in zip(tasks, reports)],
+        jobs, name="download")
+    return reports, paths
 
 
 #
 # Update the report file - updates the report file with one or more artifacts from downloadReport
 #
-def updateReport(reportFile, downloadReport):
-    lastReport = []
-    if os.path.exists(reportFile):
-        with open(reportFile, 'r') as inFile:
-            lastReport = json.load(inFile)
+def updateReport(reportFile, downloadReport, render=True):
+    store = ReportStore(reportFile)
+    store.upsert(downloadReport)
+    if render:
+        store.render()
 
-    # First remove any items from lastReport that match something we've just downloaded
-    for item in downloadReport:
-        lastReport = [rpt for rpt in lastReport if rpt['name'] != item['name']]
 
-    # Now add our items to the report and sort it
-    lastReport.extend(downloadReport)
+def parseExtractTarget(value):
+    """Parse a NAME=DIR[:STRIP] value of --extract."""
+    name, sep, target = value.partition("=")
+    if not sep or not name or not target:
+        raise argparse.ArgumentTypeError("expected NAME=DIR[:STRIP], got %r" % value)
+    directory, sep, strip = target.rpartition(":")
+    if not sep or not strip.isdigit():
+        directory, strip = target, "0"
+    return name, (directory, int(strip))
 
-    def artifactName(artifactInfo):
-        return artifactInfo["name"]
 
-    sortedReport = sorted(lastReport, key=artifactName)
-
-    with open(reportFile, 'w') as outFile:
-        json.dump(sortedReport, outFile, indent=4, sort_keys=True, separators=(',', ': '))
+def main(options):
+    global artifactCache, httpSession, jenkinsMetadata, zenpackResolver
+    httpSession = http_session.Session(timeout=options.timeout, retries=options.retries)
+    extractTargets.update(options.extract or [])
 
+    if options.cache_dir:
+        artifactCache = ArtifactCache(options.cache_dir, options.cache_size * 1024 * 1024)
+        zenpackResolver = ZenPackResolver(
+            os.path.join(options.cache_dir, "resolutions"), options.resolution_ttl * 3600)
+        jenkinsMetadata = JenkinsMetadata(os.path.join(options.cache_dir, "jenkins"))
 
-def main(options):
     if options.pinned:
         #verify all versions are explicitly set to a release
         versions = json.load(options.versions)
         unpinned = []
         notLatest = []
+        if options.check_latest:
+            zenpackResolver.resolveAll(
+                [(zenpackResolver.requirementURL(artifact['name']), False)
+                    for artifact in versions if artifact['type'] == 'zenpack'],
+                options.jobs)
         for artifact in versions:
             artifactInfo = artifactClass[artifact['type']](artifact)
             if not artifactInfo.pinned:
@@ -330,6 +732,12 @@ def main(options):
                         _, pinnedVersion = artifactInfo.requirement.split('===')
                     else:
                         pinnedVersion = artifactInfo.version
+                    if isinstance(artifactInfo, ZenPackInfo) and pinnedVersion == latest:
+                        # The latest release is the pinned one, so its
+                        # resolution can be reused by the download phase.
+                        zenpackResolver.seed(
+                            zenpackResolver.query(artifact)[0],
+                            zenpackResolver.resolve(zenpackResolver.requirementURL(artifactInfo.name)))
                     if pinnedVersion != latest:
                         notLatest.append("%s pinned version %s, does not match latest: %s" % (artifactInfo.name, pinnedVersion, latest))
         errors = []
@@ -348,15 +756,28 @@ def main(options):
         manifest = json.load(options.zp_manifest)
         artifacts = list(chain(manifest['install_order'], manifest['included_not_installed']))
 
+    if options.render_report:
+        if not options.reportFile:
+            sys.exit("--render-report requires --reportFile")
+        ReportStore(options.reportFile).render()
+        sys.exit(0)
+
     if not options.git_output:
         if not artifacts or len(artifacts) == 0:
             sys.exit("No artifacts to download")
 
         downloadReport = []
-        downloadArtifacts(options.versions, artifacts, options.out_dir, downloadReport)
+        plan = downloadArtifacts(options.versions, artifacts, options.out_dir, downloadReport, options.jobs)
+
+        if options.plan:
+            with open(options.plan, 'w') as outFile:
+                json.dump(plan, outFile, indent=4, sort_keys=True, separators=(',', ': '))
 
         if options.reportFile:
-            updateReport(options.reportFile, downloadReport)
+            updateReport(options.reportFile, downloadReport, not options.defer_report)
+
+        if artifactCache:
+            artifactCache.evict()
     else:
         gitInfo = []
         versions = json.load(options.versions)
@@ -487,6 +908,11 @@ class JenkinsInfo(ArtifactInfo):
 
         return ['*.whl', '*.tgz', '*.tar.gz']
 
+    @property
+    def matcher(self):
+        """Compiled regex matching a file name against any of patterns."""
+        return re.compile("|".join("(?:%s)" % fnmatch.translate(p) for p in self.patterns))
+
     def toDict(self):
         result = super(JenkinsInfo, self).toDict()
         jenkinsDict = {
@@ -539,8 +965,7 @@ class ZenPackInfo(ArtifactInfo):
         return gitRef
 
     def getLatestVersion(self):
-        url = "http://zenpacks.zenoss.eng/requirement/%s" % self.name
-        info = json.loads(urllib2.urlopen(url).read())
+        info = zenpackResolver.resolve(zenpackResolver.requirementURL(self.name))
         return info['version']
 
 
@@ -566,6 +991,14 @@ class ZenPackInfo(ArtifactInfo):
         # Anything left is not pinned.
         return False
 
+    @property
+    def cacheable(self):
+        """Return True if the requirement names a single release, with
+        === or ==, so that its resolution can be kept on disk."""
+        if self.pre or not self.requirement or ',' in self.requirement:
+            return False
+        return '==' in self.requirement
+
     def toDict(self):
         result = super(ZenPackInfo, self).toDict()
         zpDict = {
@@ -577,6 +1010,564 @@ class ZenPackInfo(ArtifactInfo):
         return result
 
 
+class ReportStore(object):
+    """Download report kept as an append-only JSON-lines journal.
+
+    Each upsert appends one line per artifact to <reportFile>.jsonl, and
+    the last line for a name wins, so recording a download costs the same
+    however large the report is.  render() writes the sorted JSON list
+    that reportFile has always held and removes the journal; the next
+    upsert() starts a new journal from the rendered report, so a journal
+    never outlives the report it was rendered into.  Writers take an
+    exclusive lock on the journal, so several downloads may share one
+    report.
+    """
+
+    def __init__(self, reportFile):
+        self.reportFile = reportFile
+        self.journal = reportFile + ".jsonl"
+
+    def _open(self, mode, lockType):
+        while True:
+            f = open(self.journal, mode)
+            fcntl.flock(f, lockType)
+            # render() may have removed the journal while we waited for it.
+            try:
+                if os.path.samestat(os.fstat(f.fileno()), os.stat(self.journal)):
+                    return f
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            f.close()
+
+    @staticmethod
+    def _index(f):
+        index = {}
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                index[item["name"]] = item
+        return index
+
+    def upsert(self, items):
+        with self._open("a+", fcntl.LOCK_EX) as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0 and os.path.exists(self.reportFile):
+                # Start the journal from a report written before it existed.
+                with open(self.reportFile) as report:
+                    items = json.load(report) + list(items)
+            for item in items:
+                f.write(json.dumps(item, sort_keys=True) + "\n")
+
+    def items(self):
+        """Return the latest entry for each artifact, indexed by name."""
+        if not os.path.exists(self.journal):
+            return {}
+        with self._open("r", fcntl.LOCK_SH) as f:
+            return self._index(f)
+
+    def render(self):
+        with self._open("a+", fcntl.LOCK_EX) as f:
+            f.seek(0)
+            index = self._index(f)
+            # An empty journal has nothing newer than an existing report.
+            if index or not os.path.exists(self.reportFile):
+                sortedReport = [index[name] for name in sorted(index)]
+                tmpPath = privateTempPath(self.reportFile)
+                with open(tmpPath, 'w') as outFile:
+                    json.dump(sortedReport, outFile, indent=4, sort_keys=True, separators=(',', ': '))
+                os.rename(tmpPath, self.reportFile)
+            os.remove(self.journal)
+
+
+class ZenPackResolver(object):
+    """Resolves ZenPack requirements with the zenpacks requirement endpoint.
+
+    Every response is remembered for the life of the process, so the pin
+    check and the downloads share one request per requirement.  With a
+    cacheDir, responses for requirements that name a single release are
+    also stored on disk and reused by later runs: those of exact (===)
+    requirements for good, since they always resolve to the same release,
+    and those of == requirements, which a new local build of the release
+    may match, for ttl seconds.  Failed requests are remembered too and
+    re-raised by resolve().
+    """
+
+    endpoint = "http://zenpacks.zenoss.eng/requirement"
+
+    def __init__(self, cacheDir=None, ttl=0):
+        self.cacheDir = cacheDir
+        self.ttl = ttl
+        self._results = {}
+        self._lock = threading.Lock()
+        if cacheDir and not os.path.isdir(cacheDir):
+            try:
+                os.makedirs(cacheDir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def requirementURL(self, requirement, feature=None, pre=False):
+        """Return <endpoint>/<requirement>[/<feature>][?pre]."""
+        requirement = urllib.quote(requirement)
+        feature = urllib.quote(feature or "")
+        return "".join((
+            self.endpoint,
+            "/{}".format(requirement),
+            "/{}".format(feature) if feature else "",
+            "?pre" if pre else ""
+        ))
+
+    def query(self, versionInfo):
+        """Return the (url, cacheable) pair resolving a type=zenpack entry."""
+        info = ZenPackInfo(versionInfo)
+        url = self.requirementURL(info.requirement or info.name, info.feature, info.pre)
+        return url, info.cacheable
+
+    def _cachePath(self, url):
+        return os.path.join(self.cacheDir, "%s.json" % hashlib.sha1(url).hexdigest())
+
+    def _load(self, url):
+        path = self._cachePath(url)
+        exact = "===" in urllib.unquote(url)
+        try:
+            if not exact and time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get("url") != url:
+            return None
+        return entry["zenpack"]
+
+    def _store(self, url, zenpack):
+        fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"url": url, "zenpack": zenpack}, f, sort_keys=True)
+        os.chmod(tmpPath, DEFAULT_FILE_MODE)
+        os.rename(tmpPath, self._cachePath(url))
+
+    def seed(self, url, zenpack):
+        """Record zenpack as the resolution of the pinned requirement url."""
+        with self._lock:
+            self._results[url] = (zenpack, None)
+        if self.cacheDir:
+            self._store(url, zenpack)
+
+    def resolve(self, url, cacheable=False):
+        with self._lock:
+            result = self._results.get(url)
+        if result is None:
+            result = self._fetch(url, cacheable)
+            with self._lock:
+                self._results[url] = result
+        zenpack, excInfo = result
+        if excInfo:
+            raise excInfo[0], excInfo[1], excInfo[2]
+        return zenpack
+
+    def _fetch(self, url, cacheable):
+        usesCache = cacheable and self.cacheDir
+        if usesCache:
+            zenpack = self._load(url)
+            if zenpack is not None:
+                printLine("Using cached resolution for %s" % url)
+                return zenpack, None
+        try:
+            zenpack = json.loads(httpSession.get(url))
+        except Exception:
+            return None, sys.exc_info()
+        if usesCache and "url" in zenpack:
+            self._store(url, zenpack)
+        return zenpack, None
+
+    def resolveAll(self, queries, jobs=1):
+        """Resolve (url, cacheable) queries using up to jobs threads.
+
+        Errors are not raised here; resolve() raises them for the url that
+        caused them, where the caller can report them.
+        """
+        def resolve(url, cacheable):
+            try:
+                self.resolve(url, cacheable)
+            except Exception:
+                pass
+
+        http_session.runConcurrently(
+            [lambda url=url, cacheable=cacheable: resolve(url, cacheable) for url, cacheable in set(queries)],
+            jobs, name="resolve")
+
+
+class JenkinsMetadata(object):
+    """Looks up Jenkins build metadata for jenkinsDownload().
+
+    The lastSuccessfulBuild of each job is queried once per process and
+    shared by every artifact built by that job.  Finished builds never
+    change, so with a cacheDir their metadata is also kept on disk, keyed
+    by job URL and build number; a warm cache then only costs a request
+    for the lastSuccessfulBuild number.
+    """
+
+    tree = "artifacts[*],number,actions[lastBuiltRevision[*,branch[*]]]"
+
+    def __init__(self, cacheDir=None):
+        self.cacheDir = cacheDir
+        self._builds = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        if cacheDir and not os.path.isdir(cacheDir):
+            try:
+                os.makedirs(cacheDir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def _jobLock(self, jobURL):
+        with self._lock:
+            return self._locks.setdefault(jobURL, threading.Lock())
+
+    def _get(self, url):
+        try:
+            return httpSession.get(url)
+        except (http_session.HTTPError, http_session.ConnectionError) as e:
+            raise Exception("Error downloading %s: %s" % (url, e))
+
+    def _cachePath(self, *key):
+        return os.path.join(self.cacheDir, "%s.json" % hashlib.sha1(repr(key)).hexdigest())
+
+    def _cached(self, key, fetch):
+        """Return the metadata for key from disk, or fetch() and store it."""
+        if not self.cacheDir:
+            return fetch()
+        path = self._cachePath(*key)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            pass
+        data = fetch()
+        tmpPath = privateTempPath(path)
+        with open(tmpPath, "w") as f:
+            json.dump(data, f)
+        os.rename(tmpPath, path)
+        return data
+
+    def lastSuccessfulBuild(self, jobURL):
+        with self._jobLock(jobURL):
+            if jobURL not in self._builds:
+                baseURL = "%s/lastSuccessfulBuild" % jobURL
+                if self.cacheDir:
+                    number = int(self._get("%s/buildNumber" % baseURL))
+                    self._builds[jobURL] = self._cached(
+                        (jobURL, number),
+                        lambda: json.loads(self._get("%s/%d/api/json?tree=%s" % (jobURL, number, self.tree))))
+                else:
+                    self._builds[jobURL] = json.loads(self._get("%s/api/json?tree=%s" % (baseURL, self.tree)))
+            return self._builds[jobURL]
+
+    def subModuleArtifacts(self, jobURL, number, subModule):
+        url = "%s/%d/%s/api/json?tree=artifacts[*]" % (jobURL, number, subModule)
+        return self._cached(
+            (jobURL, number, subModule),
+            lambda: json.loads(self._get(url))['artifacts'])
+
+
+# Resolve ZenPack requirements and look up Jenkins builds; main() replaces
+# them with ones that keep what they can on disk when --cache-dir is given.
+zenpackResolver = ZenPackResolver()
+jenkinsMetadata = JenkinsMetadata()
+
+
+def privateTempPath(path):
+    """Return a hidden sibling of path unique to this process and thread."""
+    return os.path.join(
+        os.path.dirname(path),
+        ".%s.%d.%d" % (os.path.basename(path), os.getpid(), threading.current_thread().ident))
+
+
+# ioctl request number of FICLONE from linux/fs.h
+FICLONE = 0x40049409
+
+
+def cloneFile(source, destination):
+    """Make destination a hardlink of source.
+
+    When a hardlink is not possible (too many links, or a filesystem that
+    refuses them), falls back to a reflink, which only works within one
+    filesystem that supports it, and otherwise to a plain copy.
+    """
+    try:
+        os.link(source, destination)
+        return
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except (IOError, OSError):
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    shutil.copymode(source, destination)
+
+
+class ArtifactCache(object):
+    """Content-addressed artifact store shared by all builds on a host.
+
+    The cache directory holds:
+
+        objects/<xx>/<shasum>   artifact contents, named by their sha1
+        index/<key hash>.json   checksums recorded for a URL
+        lock                    serializes eviction between processes
+
+    Artifacts are linked into place, so a hit costs neither network I/O
+    nor a copy.  Object mtimes are bumped on every use, which makes
+    evict() a least-recently-used policy.
+    """
+
+    def __init__(self, path, maxBytes):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.objectsDir = os.path.join(path, "objects")
+        self.indexDir = os.path.join(path, "index")
+        for directory in (self.objectsDir, self.indexDir):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def objectPath(self, shasum):
+        return os.path.join(self.objectsDir, shasum[:2], shasum)
+
+    def indexPath(self, url):
+        return os.path.join(self.indexDir, "%s.json" % hashlib.sha1(url).hexdigest())
+
+    def _readIndex(self, url):
+        try:
+            with open(self.indexPath(url)) as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return {}
+        if entry.get("url") != url:
+            return {}
+        return entry
+
+    def _writeIndex(self, url, **fields):
+        entry = self._readIndex(url)
+        entry.update(fields, url=url)
+        fd, tmpPath = tempfile.mkstemp(dir=self.indexDir)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f, sort_keys=True)
+        os.chmod(tmpPath, DEFAULT_FILE_MODE)
+        os.rename(tmpPath, self.indexPath(url))
+
+    def checksums(self, url):
+        """Return the checksums last recorded for url, or None."""
+        entry = self._readIndex(url)
+        if "shasum" not in entry:
+            return None
+        return dict((field, entry.get(field)) for field in CHECKSUM_FIELDS)
+
+    def install(self, shasum, destination):
+        """Link the cached object for shasum to destination.
+
+        Returns False if the object is not in the cache.
+        """
+        source = self.objectPath(shasum)
+        if not os.path.exists(source):
+            return False
+        if os.path.exists(destination) and os.path.samefile(source, destination):
+            os.utime(source, None)
+            return True
+
+        tmpPath = privateTempPath(destination)
+        try:
+            cloneFile(source, tmpPath)
+        except (IOError, OSError) as e:
+            # A concurrent evict() may have removed the object.
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+        os.rename(tmpPath, destination)
+        os.utime(source, None)
+        return True
+
+    def add(self, url, path, digests):
+        """Record digests for url and store the content of path."""
+        objectPath = self.objectPath(digests["shasum"])
+        if not os.path.exists(objectPath):
+            objectDir = os.path.dirname(objectPath)
+            try:
+                os.mkdir(objectDir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            tmpPath = privateTempPath(objectPath)
+            cloneFile(path, tmpPath)
+            os.rename(tmpPath, objectPath)
+        self._writeIndex(url, **digests)
+
+    def evict(self):
+        """Delete least recently used objects until the cache fits maxBytes."""
+        with open(os.path.join(self.path, "lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            objects = []
+            total = 0
+            for dirPath, _, fileNames in os.walk(self.objectsDir):
+                for fileName in fileNames:
+                    path = os.path.join(dirPath, fileName)
+                    st = os.stat(path)
+                    objects.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+
+            for _, size, path in sorted(objects):
+                if total <= self.maxBytes:
+                    break
+                printLine("Evicting cached artifact %s" % path)
+                os.unlink(path)
+                total -= size
+
+
+def manifestPath(path):
+    """Return the hidden file listing what was extracted from path."""
+    return os.path.join(os.path.dirname(path), ".%s.manifest" % os.path.basename(path))
+
+
+def decompressor(path):
+    """Return the program tar should decompress path with, or None.
+
+    Raises if path is not a tar archive.
+    """
+    for suffixes, programs in ARCHIVE_FORMATS:
+        if path.endswith(suffixes):
+            if programs is None:
+                return None
+            for program in programs:
+                found = find_executable(program)
+                if found:
+                    return found
+            raise Exception("Cannot extract %s: none of %s is installed" % (path, ", ".join(programs)))
+    raise Exception("Cannot extract %s: not a tar archive" % path)
+
+
+class Extractor(object):
+    """Unpacks a tar archive into a directory while it downloads.
+
+    The archive is piped to tar, through a multi-threaded decompressor
+    such as pigz when one is installed, so unpacking overlaps with the
+    transfer.  Each write() says where its bytes sit in the archive, so a
+    transfer that resumes part way through feeds tar every byte once, in
+    order.
+
+    An archive given an Event to wait for is only unpacked after it is
+    set.  If it is not set by the time the download starts, the archive is
+    unpacked from the downloaded file by finish() instead.
+
+    finish() writes the manifest: the absolute path of every extracted
+    entry, one per line, so later steps need not rescan the directory.
+    """
+
+    def __init__(self, archive, destination, strip=0, after=None):
+        self.archive = archive
+        self.destination = os.path.abspath(destination)
+        self.strip = strip
+        self.after = after
+        self.manifestPath = manifestPath(archive)
+        self.program = decompressor(archive)
+        self.position = 0
+        self._process = None
+        self._listing = None
+
+    def _start(self):
+        try:
+            os.makedirs(self.destination)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        command = ["tar", "-x", "-v", "--show-transformed-names", "-C", self.destination, "-f", "-"]
+        if self.strip:
+            command.append("--strip-components=%d" % self.strip)
+        if self.program:
+            command.append("--use-compress-program=%s" % self.program)
+        self._listing = tempfile.TemporaryFile()
+        # Without close_fds, a tar started by another download thread would
+        # inherit this one's stdin pipe and keep it from ever seeing EOF.
+        self._process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=self._listing, close_fds=True)
+        self.position = 0
+
+    def _failed(self):
+        self._process.stdin.close()
+        return Exception("Extracting %s into %s failed: tar exited with %s" % (
+            self.archive, self.destination, self._process.wait()))
+
+    def restart(self):
+        """Start over from the first byte of the archive."""
+        if self.position:
+            self.abort()
+
+    def write(self, offset, data):
+        """Pass the bytes of data, found at offset in the archive, to tar."""
+        if self._process is None and (offset != self.position or self.after and not self.after.is_set()):
+            # Left to finish(), which waits for the archive before this one.
+            return
+        skip = self.position - offset
+        if skip < 0:
+            raise Exception("Extracting %s: bytes %d to %d are missing" % (self.archive, self.position, offset))
+        if skip >= len(data):
+            return
+        if self._process is None:
+            self._start()
+        try:
+            self._process.stdin.write(data[skip:] if skip else data)
+        except IOError:
+            # Not an IOError, which downloads treat as a broken transfer.
+            raise self._failed()
+        self.position = offset + len(data)
+
+    def finish(self, path):
+        """Feed tar whatever part of path it has not seen, then wait for it."""
+        if self.after:
+            # wait() without a timeout blocks KeyboardInterrupt in python2
+            while not self.after.wait(1):
+                pass
+        with open(path, "rb") as f:
+            f.seek(self.position)
+            chunk = f.read(CHUNK_SIZE)
+            while chunk:
+                self.write(self.position, chunk)
+                chunk = f.read(CHUNK_SIZE)
+        if self._process is None:
+            # An empty archive; let tar reject it.
+            self._start()
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise self._failed()
+
+        self._listing.seek(0)
+        tmpPath = privateTempPath(self.manifestPath)
+        with open(tmpPath, "w") as manifest:
+            for line in self._listing:
+                manifest.write(os.path.join(self.destination, line))
+        os.rename(tmpPath, self.manifestPath)
+        self._listing.close()
+        self._process = self._listing = None
+        printLine("Extracted %s into %s" % (self.archive, self.destination))
+
+    def abort(self):
+        """Stop tar, leaving whatever it has extracted so far."""
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.stdin.close()
+            self._process.wait()
+            self._listing.close()
+        self._process = self._listing = None
+        self.position = 0
+
+
 #
 artifactClass = {
     "download": URLDownloadInfo,
@@ -593,15 +1584,47 @@ if __name__ == '__main__':
     parser.add_argument('--out_dir', type=str, default=".",
                         help='directory to download files')
 
+    parser.add_argument('--timeout', type=int, default=http_session.DEFAULT_TIMEOUT,
+                        help='seconds to wait on a network operation, defaults to %d' % http_session.DEFAULT_TIMEOUT)
+
+    parser.add_argument('--retries', type=int, default=http_session.DEFAULT_RETRIES,
+                        help='times to retry a failed request, defaults to %d' % http_session.DEFAULT_RETRIES)
+
+    parser.add_argument('--cache-dir', type=str, default="",
+                        help='directory of an artifact cache shared between builds')
+
+    parser.add_argument('--cache-size', type=int, default=20480,
+                        help='size limit of the artifact cache in MiB, defaults to 20480')
+
+    parser.add_argument('--resolution-ttl', type=int, default=168,
+                        help='hours to reuse cached resolutions of == ZenPack requirements, defaults to 168; '
+                             'resolutions of === requirements never expire')
+
     parser.add_argument('--zp_manifest', type=file,
                         help='json file with list of zenpacks to be packaged or installed')
 
     parser.add_argument('artifacts', nargs='*',
                         help='artifacts to download')
 
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of artifacts to download in parallel, defaults to 1')
+
+    parser.add_argument('--extract', type=parseExtractTarget, action="append", metavar="NAME=DIR[:STRIP]",
+                        help='unpack the tar archive of artifact NAME into DIR while it downloads, '
+                             'removing STRIP leading path components; may be repeated')
+
+    parser.add_argument('--plan', type=str, default="",
+                        help='write a json list of the name, type and downloaded path of each artifact to this file')
+
     parser.add_argument('--reportFile', type=str, default="",
                         help='json report of downloaded artifacts')
 
+    parser.add_argument('--defer-report', action="store_true",
+                        help='only record downloads in the report journal, use --render-report to write reportFile')
+
+    parser.add_argument('--render-report', action="store_true",
+                        help='write reportFile from its journal and exit')
+
     parser.add_argument('--git_output', type=str, default="",
                         help='output git repo information for artifacts instead of downloading, value is name of file')
 
@@ -58,7 +58,7 @@ pipeline {
                         python compare_builds.py \
                             -b1 ${params.BRANCH}/${params.BUILD1_NAME}/${params.BUILD1_JOB_NBR} \
                             -b2 ${params.BRANCH}/${params.BUILD2_NAME}/${params.BUILD2_JOB_NBR} \
-                            --output-format json > output/zingChanges.json
+                            --output-format json --buffered > output/zingChanges.json
                     """
 
                     withCredentials([
@@ -39,12 +39,15 @@ download_zenpacks: | $(ZENPACK_DIR)
 	@../artifact_download.py \
 		--zp_manifest zenpacks.json \
 		--out_dir zenpacks \
+		--jobs 8 \
+		$(ARTIFACT_CACHE_OPTION) \
 		--reportFile zenpacks_artifact.log \
 		../zenpack_versions.json
 
 clean:
 	@rm -rf $(ZENPACK_DIR)
 	@rm -f copy_upgrade_scripts.sh $(UPGRADE_SCRIPTS) zenoss_component_artifact.log zenpacks_artifact.log
+	@rm -f zenoss_component_artifact.log.jsonl zenpacks_artifact.log.jsonl
 	@-docker image rm -f $(PRODUCT_IMAGE_ID) $(MARIADB_IMAGE_ID) 2>/dev/null
 
 getDownloadLogs:
@@ -3,13 +3,20 @@
 import re
 import argparse
 import collections
+import errno
+import hashlib
 import json
 import os
+import shutil
 import string
 import sys
-import urllib2
+import tempfile
+import threading
 import urlparse
 
+import http_session
+import versions
+
 from itertools import chain
 
 
@@ -27,79 +34,86 @@ def compare_artifacts(logfile1, logfile2):
     artifacts1 = buildDictionary(logList1)
     artifacts2 = buildDictionary(logList2)
 
-    diffs = {}
-    for name, item in artifacts1.iteritems():
-        if name in artifacts2:
-            diff = DiffInfo(name, item, artifacts2[name])
-        else:
-            diff = DiffInfo(name, item, ArtifactInfo({"name": name}))
-        diffs[name] = diff
-
-    for name, item in artifacts2.iteritems():
-        if not name in artifacts1:
-            diff = DiffInfo(name, ArtifactInfo({"name": name}), item)
-            diffs[name] = diff
-
-    return collections.OrderedDict(sorted(diffs.items()))
+    # Yield each DiffInfo as it is made, in name order, so that results
+    # can be written out as the comparison goes.
+    diffs = (
+        DiffInfo(
+            name,
+            artifacts1.get(name) or ArtifactInfo({"name": name}),
+            artifacts2.get(name) or ArtifactInfo({"name": name}))
+        for name in sorted(set(artifacts1) | set(artifacts2))
+    )
+    if options.by_risk:
+        # Every DiffInfo has to be made before the riskiest is known.
+        diffs = sorted(diffs, key=lambda diff: versions.changeRisk(diff.change))
+    for diff in diffs:
+        yield diff
+
+def repoLink(gitRepo):
+    """Turn a git@host:owner/name.git URL into host/owner/name."""
+    return re.sub(r'^git\@([^:]+)\:([^\/]+)\/(.+?)\.git$', r'\1/\2/\3', gitRepo)
+
+def diffMarker(item, marker):
+    """Return the marker of an item that is different, followed by its kind
+    of change with --show-change, or with --by-risk outside of -q output."""
+    if not item.different:
+        return ""
+    if options.show_change or options.by_risk and not options.quiet:
+        return " %s (%s)" % (marker, item.change)
+    return " %s" % marker
 
 def compare_components(logfile1, logfile2):
     componentDiffs = compare_artifacts(logfile1, logfile2)
     if not options.quiet and options.output_format == "plain":
-        Output.println("Component Differences:")
-        Output.println("%-40.40s %-32.32s %-32.32s Different" % ("Name", "c1 (gitRef)", "c2 (gitRef)"))
-    for name, item in componentDiffs.iteritems():
+        output.println("Component Differences:")
+        output.println("%-40.40s %-32.32s %-32.32s Different" % ("Name", "c1 (gitRef)", "c2 (gitRef)"))
+    for item in componentDiffs:
         if not options.verbose and not item.different:
             continue
         if options.output_format == "plain":
-            if item.different:
-                diffIndicator = " Y"
-            else:
-                diffIndicator = ""
+            diffIndicator = diffMarker(item, "Y")
             if not options.quiet:
-                Output.println("%-40.40s %-32.32s %-32.32s%s" % (item.name, item.artifact1.versionInfo, item.artifact2.versionInfo, diffIndicator))
+                output.println("%-40.40s %-32.32s %-32.32s%s" % (item.name, item.artifact1.versionInfo, item.artifact2.versionInfo, diffIndicator))
             else:
-                Output.println("%s %s %s %s" % (item.name, item.artifact1.versionInfo, item.artifact2.versionInfo, diffIndicator))
+                output.println("%s %s %s %s" % (item.name, item.artifact1.versionInfo, item.artifact2.versionInfo, diffIndicator))
         else:
             # Build HTTPS link to repository
-            repo = re.sub(r'^git\@([^:]+)\:([^\/]+)\/(.+?)\.git$', r'\1/\2/\3', item.artifact1.gitRepo)
+            repo = repoLink(item.artifact1.gitRepo)
 
             # Sort component versions
-            start, end = sorted([item.artifact1.gitRef, item.artifact2.gitRef])
+            start, end = sorted([item.artifact1.gitRef, item.artifact2.gitRef], key=versions.sortKey)
 
             # Send data to output
-            Output.println({"service": item.name, "repo": repo, "start": start, "end": end})
+            output.println({"service": item.name, "repo": repo, "start": start, "end": end, "change": item.change})
 
 def compare_zenpacks(logfile1, logfile2):
     zenPackDiffs = compare_artifacts(logfile1, logfile2)
     if not options.quiet and options.output_format == "plain":
-        Output.println("ZenPack Differences:")
-        Output.println("%-40.40s %-32.32s %-32.32s" % ("Name", "z1 (gitRef)", "z2 (gitRef)"))
+        output.println("ZenPack Differences:")
+        output.println("%-40.40s %-32.32s %-32.32s" % ("Name", "z1 (gitRef)", "z2 (gitRef)"))
     
-    for name, item in zenPackDiffs.iteritems():
+    for item in zenPackDiffs:
         if not options.verbose and not item.different:
             continue
         if options.output_format == "plain":
-            if item.different:
-                diffIndicator = " *"
-            else:
-                diffIndicator = ""
+            diffIndicator = diffMarker(item, "*")
             if not options.quiet:
-                Output.println("%-40.40s %-32.32s %-32.32s%s" % (item.name, item.artifact1.versionInfo, item.artifact2.versionInfo, diffIndicator))
+                output.println("%-40.40s %-32.32s %-32.32s%s" % (item.name, item.artifact1.versionInfo, item.artifact2.versionInfo, diffIndicator))
             else:
-                Output.println("%s %s %s %s" % (item.name, item.artifact1.versionInfo, item.artifact2.versionInfo, diffIndicator))
+                output.println("%s %s %s %s" % (item.name, item.artifact1.versionInfo, item.artifact2.versionInfo, diffIndicator))
         else:
             # Build HTTPS link to repository
-            repo = re.sub(r'^git\@([^:]+)\:([^\/]+)\/(.+?)\.git$', r'\1/\2/\3', item.artifact1.gitRepo)
+            repo = repoLink(item.artifact1.gitRepo)
 
             # Get ZenPacks versions
             start = item.artifact1.info['zenpack']['parsed_version']['local'][1:] if item.artifact1.pre else item.artifact1.versionInfo
             end = item.artifact2.info['zenpack']['parsed_version']['local'][1:] if item.artifact2.pre else item.artifact2.versionInfo
 
             # Sort ZenPacks versions
-            start, end = sorted([start, end])
+            start, end = sorted([start, end], key=versions.sortKey)
 
             # Send data to output
-            Output.println({"service": item.name, "repo": repo, "start": start, "end": end})
+            output.println({"service": item.name, "repo": repo, "start": start, "end": end, "change": item.change})
 
 def buildJobUrl(jobArg):
     # Break jobArg into an array of words
@@ -119,65 +133,299 @@ def buildJobUrl(jobArg):
     baseURL = "http://platform-jenkins.zenoss.eng/job/product-assembly/job/"
     return urlparse.urljoin(baseURL, url)
 
-def downloadLogFromJenkins(jobUrl, filename):
-    apiUrl = os.path.join(jobUrl, "api/json?tree=artifacts[*]")
-    try:
-        response = json.loads(urllib2.urlopen(apiUrl).read())
-    except urllib2.URLError as e:
-        raise Exception("Error downloading %s: %s" % (apiUrl, e))
-    except urllib2.HTTPError as e:
-        raise Exception("Error downloading %s: %s" % (apiUrl, e))
-    except httplib.HTTPException, e:
-        raise Exception("Error downloading %s: %s" % (apiUrl, e))
-
-    artifacts = response['artifacts']
-    relativePath = ""
-    for artifact in artifacts:
-        if artifact['fileName'] == filename:
-            relativePath = artifact['relativePath']
-    if relativePath == "":
-        print "ERROR: file '%s' not in job artifacts for %s" % (filename, jobUrl)
-        sys.exit(1)
+# All Jenkins requests share one pool of persistent connections.
+httpSession = http_session.Session()
+
+# Artifact logs compared by -b1/-b2.
+BUILD_LOGS = ("zenoss_component_artifact.log", "zenpacks_artifact.log")
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "compare_builds")
+
+class JenkinsLogs(object):
+    """Fetches the artifact logs of Jenkins builds.
 
-    fileUrl = os.path.join(jobUrl, "artifact")
-    fileUrl = os.path.join(fileUrl, relativePath)
+    The artifact list of a build is requested once for all of its logs,
+    and the logs are streamed to files rather than read into memory.
+    Finished builds never change, so with a cacheDir the logs of every
+    finished build are also kept on disk, keyed by job URL and build
+    number.  A build named by its number is then read without a request,
+    and one named some other way, such as lastSuccessfulBuild, with only
+    the request for its number.
+    """
 
-    try:
-        response = urllib2.urlopen(fileUrl)
-    except urllib2.URLError as e:
-        raise Exception("Error downloading %s: %s" % (fileUrl, e))
-    except urllib2.HTTPError as e:
-        raise Exception("Error downloading %s: %s" % (fileUrl, e))
-    except httplib.HTTPException, e:
-        raise Exception("Error downloading %s: %s" % (fileUrl, e))
+    tree = "building,number,artifacts[fileName,relativePath]"
 
-    return response
+    def __init__(self, cacheDir=None, jobs=8):
+        self.cacheDir = cacheDir
+        self.jobs = jobs
+        if cacheDir and not os.path.isdir(cacheDir):
+            try:
+                os.makedirs(cacheDir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def _cachePath(self, jobUrl, filename):
+        return os.path.join(self.cacheDir, hashlib.sha1(jobUrl).hexdigest(), filename)
+
+    def _number(self, jobUrl, skipMissing=False):
+        """Return jobUrl with the build it names replaced by its number.
+
+        Without a cacheDir the number is of no use, and jobUrl is returned
+        as it is.
+        """
+        job, _, build = jobUrl.rpartition("/")
+        if not self.cacheDir or build.isdigit():
+            return jobUrl
+        numberUrl = "%s/buildNumber" % jobUrl
+        try:
+            return "%s/%d" % (job, int(httpSession.get(numberUrl)))
+        except (http_session.HTTPError, http_session.ConnectionError) as e:
+            if skipMissing and getattr(e, "code", None) == 404:
+                return None
+            raise Exception("Error downloading %s: %s" % (numberUrl, e))
+
+    def _cached(self, jobUrl, filename):
+        """Return the cached log of jobUrl, or None."""
+        if not self.cacheDir or not jobUrl.rsplit("/", 1)[-1].isdigit():
+            return None
+        try:
+            return open(self._cachePath(jobUrl, filename))
+        except IOError:
+            return None
+
+    def _build(self, jobUrl, skipMissing=False):
+        apiUrl = "%s/api/json?tree=%s" % (jobUrl, self.tree)
+        try:
+            return json.loads(httpSession.get(apiUrl))
+        except (http_session.HTTPError, http_session.ConnectionError) as e:
+            if skipMissing and getattr(e, "code", None) == 404:
+                return None
+            raise Exception("Error downloading %s: %s" % (apiUrl, e))
+
+    def _download(self, jobUrl, build, filename, skipMissing=False):
+        relativePath = ""
+        for artifact in build['artifacts']:
+            if artifact['fileName'] == filename:
+                relativePath = artifact['relativePath']
+        if relativePath == "":
+            if skipMissing:
+                return None
+            print "ERROR: file '%s' not in job artifacts for %s" % (filename, jobUrl)
+            sys.exit(1)
+
+        fileUrl = os.path.join(jobUrl, "artifact")
+        fileUrl = os.path.join(fileUrl, relativePath)
+
+        try:
+            response = httpSession.open(fileUrl)
+        except (http_session.HTTPError, http_session.ConnectionError) as e:
+            raise Exception("Error downloading %s: %s" % (fileUrl, e))
+
+        if not self.cacheDir or build.get('building'):
+            logfile = tempfile.TemporaryFile()
+            shutil.copyfileobj(response, logfile)
+            logfile.seek(0)
+            return logfile
+
+        path = self._cachePath(jobUrl, filename)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        tmpPath = "%s.%d.%d" % (path, os.getpid(), threading.current_thread().ident)
+        with open(tmpPath, "wb") as logfile:
+            shutil.copyfileobj(response, logfile)
+        os.rename(tmpPath, path)
+        return open(path)
+
+    def fetch(self, jobUrls, filenames, skipMissing=False):
+        """Return {(jobUrl, filename): open log file} for every build and log.
+
+        The builds not named by their number are numbered, the builds that
+        are not cached are listed, and then their logs downloaded, each step
+        concurrently.  With skipMissing, builds that do not exist or lack a
+        log are left out instead of ending the program.
+        """
+        numberedUrls = http_session.runConcurrently(
+            [lambda jobUrl=jobUrl: self._number(jobUrl, skipMissing) for jobUrl in jobUrls],
+            self.jobs, name="fetch")
+
+        logs = {}
+        missing = collections.OrderedDict()
+        for jobUrl, numberedUrl in zip(jobUrls, numberedUrls):
+            if numberedUrl is None:
+                continue
+            for filename in filenames:
+                logfile = self._cached(numberedUrl, filename)
+                if logfile is not None:
+                    logs[(jobUrl, filename)] = logfile
+                else:
+                    missing.setdefault((jobUrl, numberedUrl), []).append(filename)
+
+        builds = http_session.runConcurrently(
+            [lambda numberedUrl=numberedUrl: self._build(numberedUrl, skipMissing)
+             for _, numberedUrl in missing],
+            self.jobs, name="fetch")
+        downloads = [
+            (jobUrl, numberedUrl, build, filename)
+            for ((jobUrl, numberedUrl), filenames), build in zip(missing.items(), builds)
+            if build is not None
+            for filename in filenames
+        ]
+        logfiles = http_session.runConcurrently(
+            [lambda args=args: self._download(*args[1:], skipMissing=skipMissing) for args in downloads],
+            self.jobs, name="fetch")
+        for (jobUrl, _, _, filename), logfile in zip(downloads, logfiles):
+            if logfile is not None:
+                logs[(jobUrl, filename)] = logfile
+        return logs
+
+def parseBuildRange(jobArg):
+    """Split a job argument like develop/core-pipeline/100..150 into the
+    job and its list of build numbers."""
+    job, _, numbers = string.rstrip(jobArg, "/").rpartition("/")
+    match = re.match(r'^(\d+)\.\.(\d+)$', numbers)
+    if not job or not match:
+        sys.exit("build range '%s' is invalid. Should be like develop/core-pipeline/100..150" % jobArg)
+    first, last = int(match.group(1)), int(match.group(2))
+    if first >= last:
+        sys.exit("build range '%s' is invalid. The first build should be before the last one" % jobArg)
+    return job, range(first, last + 1)
+
+class VersionMatrix(object):
+    """The versionInfo of every artifact in each of a sequence of builds.
+
+    Each distinct versionInfo is stored once, in versions; the row of an
+    artifact holds the index of its versionInfo in every build, 0 ("n/a")
+    where the build does not have it.
+    """
+
+    def __init__(self, builds):
+        self.builds = list(builds)
+        self.versions = ["n/a"]
+        self.rows = {}
+        self.artifacts = {}
+        self._indexes = {"n/a": 0}
+
+    def _index(self, versionInfo):
+        if versionInfo not in self._indexes:
+            self._indexes[versionInfo] = len(self.versions)
+            self.versions.append(versionInfo)
+        return self._indexes[versionInfo]
+
+    def add(self, column, logfile):
+        """Add the artifact log of the build in column."""
+        for name, artifact in buildDictionary(json.load(logfile)).iteritems():
+            if name not in self.rows:
+                self.rows[name] = [0] * len(self.builds)
+            self.rows[name][column] = self._index(artifact.versionInfo)
+            # Builds are added in order, so this ends up the latest one.
+            self.artifacts[name] = artifact
+
+    def first(self, name):
+        return self.versions[self.rows[name][0]]
+
+    def changes(self, name):
+        """Return (build, from, to) for each build that changed name."""
+        row = self.rows[name]
+        return [
+            (self.builds[column], self.versions[row[column - 1]], self.versions[row[column]])
+            for column in range(1, len(row))
+            if row[column] != row[column - 1]
+        ]
+
+def compare_range(jobArg):
+    """Report the builds of a range in which each artifact changed."""
+    job, numbers = parseBuildRange(jobArg)
+    jenkinsLogs = JenkinsLogs(options.cache_dir, options.jobs)
+    jobUrls = [buildJobUrl("%s/%d" % (job, number)) for number in numbers]
+    logs = jenkinsLogs.fetch(jobUrls, BUILD_LOGS, skipMissing=True)
+
+    found = [
+        (number, jobUrl) for number, jobUrl in zip(numbers, jobUrls)
+        if all((jobUrl, filename) in logs for filename in BUILD_LOGS)
+    ]
+    skipped = sorted(set(numbers) - set(number for number, _ in found))
+    if len(found) < 2:
+        sys.exit("build range '%s' has fewer than 2 builds with artifact logs" % jobArg)
+
+    output.listName = "artifacts"
+    output.describe(job=job, builds=[number for number, _ in found], skipped=skipped)
+
+    for filename, kind, title in zip(BUILD_LOGS, ("component", "zenpack"), ("Component", "ZenPack")):
+        matrix = VersionMatrix(number for number, _ in found)
+        for column, (_, jobUrl) in enumerate(found):
+            matrix.add(column, logs[(jobUrl, filename)])
+
+        if not options.quiet and options.output_format == "plain":
+            if kind != "component":
+                output.println("")
+            output.println("%s Changes in %s:" % (title, jobArg))
+            output.println("%-40.40s %-8s %-32.32s %-32.32s" % ("Name", "Build", "From", "To"))
+        for name in sorted(matrix.rows):
+            changes = matrix.changes(name)
+            if not changes and not options.verbose:
+                continue
+            if options.output_format == "json":
+                output.println({
+                    "kind": kind,
+                    "name": name,
+                    "repo": repoLink(matrix.artifacts[name].gitRepo),
+                    "first": matrix.first(name),
+                    "changes": [
+                        {"build": build, "from": old, "to": new}
+                        for build, old, new in changes
+                    ],
+                })
+            elif not options.quiet:
+                output.println("%-40.40s %-8d %-32.32s %-32.32s" % (
+                    name, found[0][0], "", matrix.first(name)))
+                for build, old, new in changes:
+                    output.println("%-40.40s %-8d %-32.32s %-32.32s" % ("", build, old, new))
+            else:
+                for build, old, new in changes:
+                    output.println("%s %d %s %s" % (name, build, old, new))
+
+    if skipped and not options.quiet and options.output_format == "plain":
+        output.println("")
+        output.println("Builds without artifact logs: %s" % ", ".join(str(number) for number in skipped))
+    output.close()
 
 def main(options):
 
+    if options.build_range:
+        if options.build_job_1 or options.build_job_2 or options.component_log_1 or options.zenpacks_log_1:
+            sys.exit("--build_range cannot be combined with other builds or log files")
+        compare_range(options.build_range)
+        return
+
     if options.build_job_1 is None and options.build_job_2 is not None \
        or \
        options.build_job_1 is not None and options.build_job_2 is None:
        sys.exit("if either of --build_job_1 or --build_job_2 is specified, both must be specified")
 
     if options.build_job_1:
-        jobUrl = buildJobUrl(options.build_job_1)
-        component_log_1 = downloadLogFromJenkins(jobUrl, "zenoss_component_artifact.log")
-        zenpacks_log_1 = downloadLogFromJenkins(jobUrl, "zenpacks_artifact.log")
-
-        jobUrl = buildJobUrl(options.build_job_2)
-        component_log_2 = downloadLogFromJenkins(jobUrl, "zenoss_component_artifact.log")
-        zenpacks_log_2 = downloadLogFromJenkins(jobUrl, "zenpacks_artifact.log")
+        jenkinsLogs = JenkinsLogs(options.cache_dir, options.jobs)
+        jobUrl1 = buildJobUrl(options.build_job_1)
+        jobUrl2 = buildJobUrl(options.build_job_2)
+        logs = jenkinsLogs.fetch([jobUrl1, jobUrl2], BUILD_LOGS)
+        component_log_1 = logs[(jobUrl1, "zenoss_component_artifact.log")]
+        zenpacks_log_1 = logs[(jobUrl1, "zenpacks_artifact.log")]
+        component_log_2 = logs[(jobUrl2, "zenoss_component_artifact.log")]
+        zenpacks_log_2 = logs[(jobUrl2, "zenpacks_artifact.log")]
 
         compare_components(component_log_1, component_log_2)
 
         # Add a blank link before reporting ZP diffs
         if options.output_format == "plain":
-            Output.println("")
+            output.println("")
 
         compare_zenpacks(zenpacks_log_1, zenpacks_log_2)
 
-        Output.flush()
+        output.close()
         return
 
     if options.component_log_1 is None and options.component_log_2 is not None \
@@ -199,10 +447,10 @@ def main(options):
     if options.zenpacks_log_1:
         # if we already reported on component differences, add a blank link before reporting ZP diffs
         if options.component_log_1 and options.output_format == "plain":
-            Output.println("")
+            output.println("")
         compare_zenpacks(options.zenpacks_log_1, options.zenpacks_log_2)
 
-    Output.flush()
+    output.close()
 
 class DiffInfo(object):
     def __init__(self, name, artifact1, artifact2):
@@ -223,6 +471,15 @@ class DiffInfo(object):
             return False
         return True
 
+    @property
+    def change(self):
+        """Kind of change from artifact1 to artifact2, one of versions.CHANGE_KINDS"""
+        change = versions.classifyChange(self.artifact1.comparableVersion, self.artifact2.comparableVersion)
+        if change == "same" and self.different:
+            # The same version built from another git ref
+            return "other"
+        return change
+
     def toDict(self):
         return {
             "name": self.name,
@@ -243,6 +500,11 @@ class ArtifactInfo(object):
     def version(self):
         return self.info.get('version', None)
 
+    @property
+    def comparableVersion(self):
+        """The version string that classifies changes to this artifact"""
+        return self.version
+
     @property
     def infoType(self):
         return self.info['type']
@@ -387,6 +649,10 @@ class ZenPackInfo(ArtifactInfo):
             return True
         return False
 
+    @property
+    def comparableVersion(self):
+        return self.info.get('zenpack', {}).get('version')
+
     @property
     def versionInfo(self):
         zenpack = self.info.get('zenpack')
@@ -412,30 +678,50 @@ artifactClass = {
 }
 
 class Output(object):
-    """Results buffer"""
-
-    # Buffer data
-    data = []   
-
-    @classmethod
-    def println(cls, line):
-        """Print line to output buffer"""
-        cls.data.append(line)
-
-    @classmethod
-    def plain(cls):
-        """Print buffer to stdout"""
-        return os.linesep.join(cls.data)
-
-    @classmethod
-    def json(cls):
-        """Format and print buffer as JSON"""
-        return json.dumps({"services": cls.data}, indent=4)
+    """Writes results as they are produced.
+
+    Plain lines, or in the json format one JSON record per line, are
+    written and flushed at once.  With buffered, the json records are
+    instead kept and written by close() as a single document, with the
+    records in a listName list, as {"services": [...]} by default.
+    """
+
+    def __init__(self, stream, outputFormat, buffered=False, listName="services"):
+        self.stream = stream
+        self.outputFormat = outputFormat
+        self.buffered = buffered
+        self.listName = listName
+        self.fields = collections.OrderedDict()
+        self.records = []
+
+    def _write(self, line):
+        self.stream.write(line + os.linesep)
+        self.stream.flush()
+
+    def describe(self, **fields):
+        """Add fields that describe the whole json output"""
+        if self.outputFormat != "json":
+            return
+        if self.buffered:
+            self.fields.update(fields)
+        else:
+            self._write(json.dumps(fields, sort_keys=True))
+
+    def println(self, line):
+        """Write a plain line, or a json record"""
+        if self.outputFormat != "json":
+            self._write(line)
+        elif self.buffered:
+            self.records.append(line)
+        else:
+            self._write(json.dumps(line, sort_keys=True))
 
-    @classmethod
-    def flush(cls):
-        """Display buffer"""
-        print getattr(cls, options.output_format)()
+    def close(self):
+        """Write the buffered json document"""
+        if self.outputFormat == "json" and self.buffered:
+            document = dict(self.fields)
+            document[self.listName] = self.records
+            self._write(json.dumps(document, indent=4))
 
 
 if __name__ == '__main__':
@@ -445,6 +731,10 @@ if __name__ == '__main__':
     parser.add_argument('-b2',  '--build_job_2', type=str,
                         help='jenkins build job 2; e.g. develop/core-pipeline/6')
 
+    parser.add_argument('-r', '--build_range', type=str,
+                        help='range of jenkins builds to report the version changes of; '
+                             'e.g. develop/core-pipeline/100..150')
+
     parser.add_argument('-c1', '--component_log_1', type=file,
                         help='zenoss_component_artifact log file 1')
     parser.add_argument('-c2',  '--component_log_2', type=file,
@@ -455,14 +745,32 @@ if __name__ == '__main__':
     parser.add_argument('-z2', '--zenpacks_log_2', type=file,
                         help='zenpacks_artifact log file 2')
 
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR,
+                        help='directory of the artifact logs of finished builds, defaults to %s; '
+                             'an empty value disables the cache' % DEFAULT_CACHE_DIR)
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help='number of Jenkins requests made at once, defaults to 8')
+
     parser.add_argument('-v', '--verbose', action="store_true",
                         help='show all items compared, not just the ones that are different')
 
+    parser.add_argument('--by-risk', action="store_true",
+                        help='order differences by kind of change, downgrades and major changes first, '
+                             'instead of by name, and show the kind of change unless --quiet')
+
+    parser.add_argument('--show-change', action="store_true",
+                        help='show the kind of change of each difference, also with --quiet')
+
     parser.add_argument('-q', '--quiet', action="store_true",
                         help='quiet output, suitable for further results processing')
 
     parser.add_argument('-f', '--output-format', type=str, choices=['plain', 'json'], default='plain',
                         help='format of output: json, plain(default)')
 
+    parser.add_argument('--buffered', action="store_true",
+                        help='with -f json, write one JSON document once the comparison has finished '
+                             'instead of a JSON record per line as results are found')
+
     options = parser.parse_args()
+    output = Output(sys.stdout, options.output_format, options.buffered)
     main(options)
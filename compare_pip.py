@@ -6,10 +6,19 @@ Python 3rd-party dependencies comparison utility.
 """
 
 import os
+import re
 import sys
 import json
 import logging
+import tarfile
+import zipfile
 import argparse
+import collections
+
+from cStringIO import StringIO
+from email.parser import Parser
+
+import versions
 
 
 __author__ = "Zenoss Inc."
@@ -51,26 +60,357 @@ def parse_packages(filename):
 
 def compare_packages(previous_deps, current_deps):
     """
-    Compare dependencies lists
+    Compare dependencies lists, riskiest changes first
     :param previous_deps: previous dependencies list
     :param current_deps: current dependencies list
     :type previous_deps: dict
     :type current_deps: dict
     :return: dependencies lists difference
-    :rtype: dict
+    :rtype: list
     """
 
     logging.debug("Compare dependencies lists...")
 
-    return list([
+    difference = [
         {
             "package": package,
             "previous": previous_deps.get(package, None),
             "current": current_deps.get(package, None),
+            "change": versions.classifyChange(
+                previous_deps.get(package, None),
+                current_deps.get(package, None),
+            ),
         }
-        for package in set(previous_deps.keys() + current_deps.keys())
+        for package in set(previous_deps) | set(current_deps)
         if previous_deps.get(package, None) != current_deps.get(package, None)
-    ])
+    ]
+
+    return sorted(
+        difference,
+        key=lambda package: (
+            versions.changeRisk(package["change"]),
+            package["package"].lower(),
+        ),
+    )
+
+
+def normalize_name(name):
+    """
+    Normalize Python package name, so that spellings of it compare equal
+    :param name: package name
+    :type name: str
+    :return: normalized package name
+    :rtype: str
+    """
+
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def parse_requirement(requirement):
+    """
+    Get name of package required by Requires-Dist or requires.txt line
+    :param requirement: requirement, e.g. "requests (>=2.0); extra == 'security'"
+    :type requirement: str
+    :return: normalized package name, or None for optional requirement
+    :rtype: str
+    """
+
+    requirement, _, marker = requirement.partition(";")
+    if re.search(r"\bextra\s*==", marker):
+        return None
+    match = re.match(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)", requirement)
+    return normalize_name(match.group(1)) if match else None
+
+
+def parse_metadata(text):
+    """
+    Parse METADATA file of wheel or PKG-INFO file of sdist
+    :param text: metadata file content
+    :type text: str
+    :return: package name, version and names of required packages
+    :rtype: tuple
+    """
+
+    metadata = Parser().parsestr(text, headersonly=True)
+    requires = [
+        parse_requirement(requirement)
+        for requirement in metadata.get_all("Requires-Dist") or []
+    ]
+    return (
+        metadata["Name"],
+        metadata["Version"],
+        set(name for name in requires if name),
+    )
+
+
+def parse_requires_txt(text):
+    """
+    Parse requires.txt file of sdist egg-info, skipping extras sections
+    :param text: requires.txt file content
+    :type text: str
+    :return: names of required packages
+    :rtype: set
+    """
+
+    requires = set()
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("["):
+            break
+        if line and not line.startswith("#"):
+            requires.add(parse_requirement(line))
+    requires.discard(None)
+    return requires
+
+
+def read_wheel(wheel_file):
+    """
+    Read metadata of wheel without unpacking it
+    :param wheel_file: seekable wheel file object
+    :type wheel_file: file
+    :return: package name, version and names of required packages
+    :rtype: tuple
+    """
+
+    wheel = zipfile.ZipFile(wheel_file)
+    for path in wheel.namelist():
+        if re.match(r"^[^/]+\.dist-info/METADATA$", path):
+            return parse_metadata(wheel.read(path))
+    return None
+
+
+def read_sdist(members):
+    """
+    Read metadata of sdist from its PKG-INFO and egg-info/requires.txt
+    :param members: iterable of (path, read function) of sdist files
+    :type members: iterable
+    :return: package name, version and names of required packages
+    :rtype: tuple
+    """
+
+    package = None
+    requires = set()
+    for path, read in members:
+        parts = path.strip("/").split("/")
+        if len(parts) == 2 and parts[1] == "PKG-INFO":
+            name, version, metadata_requires = parse_metadata(read())
+            package = (name, version)
+            requires |= metadata_requires
+        elif (
+            len(parts) >= 2
+            and parts[-1] == "requires.txt"
+            and parts[-2].endswith(".egg-info")
+        ):
+            requires |= parse_requires_txt(read())
+    if package is None:
+        return None
+    return package + (requires,)
+
+
+def tar_members(tar):
+    """
+    Iterate over regular files of tar archive opened in stream mode
+    :param tar: tar archive
+    :type tar: tarfile.TarFile
+    :return: (path, read function) of every file
+    :rtype: generator
+    """
+
+    for member in tar:
+        if member.isfile():
+            yield member.name, tar.extractfile(member).read
+
+
+def read_distribution(filename, dist_file):
+    """
+    Read metadata of wheel or sdist, by its file name
+    :param filename: distribution file name
+    :param dist_file: distribution file object, read from start to end
+    :type filename: str
+    :type dist_file: file
+    :return: package name, version and names of required packages, or
+        None if the file is not a distribution
+    :rtype: tuple
+    """
+
+    if filename.endswith(".whl"):
+        # Zip archives keep their index at the end, so the wheel is read
+        # into memory; a single wheel is small next to the bundle.
+        return read_wheel(StringIO(dist_file.read()))
+    if filename.endswith((".tar.gz", ".tgz", ".tar.bz2")):
+        # Stream mode reads the archive once, front to back, so a nested
+        # sdist needs no seeking either.
+        tar = tarfile.open(fileobj=dist_file, mode="r|*")
+        try:
+            return read_sdist(tar_members(tar))
+        finally:
+            tar.close()
+    if filename.endswith(".zip"):
+        sdist = zipfile.ZipFile(StringIO(dist_file.read()))
+        return read_sdist(
+            (path, lambda path=path: sdist.read(path))
+            for path in sdist.namelist()
+        )
+    return None
+
+
+def parse_bundle(path):
+    """
+    Read wheel and sdist metadata of zenoss-py-deps bundle, without
+    unpacking it to disk
+    :param path: path to bundle tarball or to directory it was unpacked to
+    :type path: str
+    :return: packages by normalized name, each a dict with name, version
+        and requires (normalized names of packages in the bundle)
+    :rtype: dict
+    """
+
+    logging.debug('Reading dependencies from bundle "%s"...', path)
+
+    packages = {}
+
+    def add(filename, dist_file):
+        try:
+            distribution = read_distribution(filename, dist_file)
+        except (tarfile.TarError, zipfile.BadZipfile, IOError) as e:
+            logging.warning('Cannot read "%s" in "%s": %s', filename, path, e)
+            return
+        if distribution is None or not distribution[0]:
+            return
+        name, version, requires = distribution
+        packages[normalize_name(name)] = {
+            "name": name,
+            "version": version,
+            "requires": requires,
+        }
+
+    try:
+        if os.path.isdir(path):
+            for directory, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    with open(os.path.join(directory, filename), "rb") as dist:
+                        add(filename, dist)
+        else:
+            # Stream mode reads the tarball once, without seeking back.
+            bundle = tarfile.open(path, mode="r|*")
+            for member in bundle:
+                if member.isfile():
+                    add(
+                        os.path.basename(member.name),
+                        bundle.extractfile(member),
+                    )
+            bundle.close()
+    except (IOError, OSError, tarfile.TarError) as e:
+        logging.critical('Cannot read bundle "%s": %s', path, e)
+        sys.exit(1)
+
+    # Requirements on packages outside the bundle are not part of the graph
+    for package in packages.values():
+        package["requires"] &= set(packages)
+
+    return packages
+
+
+def top_level_packages(packages):
+    """
+    Find packages of bundle that no other package of it requires
+    :param packages: packages by normalized name, as from parse_bundle()
+    :type packages: dict
+    :return: normalized names of top-level packages
+    :rtype: set
+    """
+
+    required = set()
+    for package in packages.values():
+        required |= package["requires"]
+    return set(packages) - required
+
+
+def reverse_requirements(packages):
+    """
+    Index packages of bundle by the packages they require
+    :param packages: packages by normalized name, as from parse_bundle()
+    :type packages: dict
+    :return: normalized names of requiring packages by required one
+    :rtype: dict
+    """
+
+    required_by = collections.defaultdict(set)
+    for requirer, package in packages.items():
+        for required in package["requires"]:
+            required_by[required].add(requirer)
+    return required_by
+
+
+def requiring_packages(required_by, name):
+    """
+    Find packages that require package, directly or transitively
+    :param required_by: requiring packages index, as from
+        reverse_requirements()
+    :param name: normalized package name
+    :type required_by: dict
+    :type name: str
+    :return: normalized names of requiring packages
+    :rtype: set
+    """
+
+    found = set()
+    pending = [name]
+    while pending:
+        for requirer in required_by[pending.pop()]:
+            if requirer not in found:
+                found.add(requirer)
+                pending.append(requirer)
+    found.discard(name)
+    return found
+
+
+def compare_bundles(previous_bundle, current_bundle):
+    """
+    Compare packages of bundles, attributing each transitive change to
+    the top-level changes that pulled it in
+    :param previous_bundle: previous bundle packages, as from parse_bundle()
+    :param current_bundle: current bundle packages, as from parse_bundle()
+    :type previous_bundle: dict
+    :type current_bundle: dict
+    :return: dependencies lists difference, riskiest changes first
+    :rtype: list
+    """
+
+    packages_difference = compare_packages(
+        {name: package["version"] for name, package in previous_bundle.items()},
+        {name: package["version"] for name, package in current_bundle.items()},
+    )
+    changed = set(package["package"] for package in packages_difference)
+    previous_graph = (
+        previous_bundle,
+        top_level_packages(previous_bundle),
+        reverse_requirements(previous_bundle),
+    )
+    current_graph = (
+        current_bundle,
+        top_level_packages(current_bundle),
+        reverse_requirements(current_bundle),
+    )
+
+    for package in packages_difference:
+        name = package["package"]
+        # A removed package was pulled in by what required it before
+        bundle, top_level, required_by = (
+            current_graph if name in current_bundle else previous_graph
+        )
+        package["package"] = bundle[name]["name"]
+        if name in top_level:
+            package["pulled_in_by"] = "(top-level)"
+            continue
+        pulled_in_by = (
+            requiring_packages(required_by, name) & top_level & changed
+        )
+        package["pulled_in_by"] = ", ".join(
+            sorted(bundle[requirer]["name"] for requirer in pulled_in_by)
+        ) or "-"
+
+    return packages_difference
 
 
 def report_format(packages_difference):
@@ -86,7 +426,14 @@ def report_format(packages_difference):
 
     # Initialize output buffer and format
     output = ""
-    line_format = "{package:<30} {previous:^10} {current:^10}" + os.linesep
+    line_format = "{package:<30} {previous:^10} {current:^10}"
+    # Only columns followed by another one are padded, so that no line
+    # ends in whitespace.
+    if packages_difference and "pulled_in_by" in packages_difference[0]:
+        line_format += " {change:<11} {pulled_in_by}"
+    else:
+        line_format += " {change}"
+    line_format += os.linesep
 
     # Add packages data to output
     for package in packages_difference:
@@ -124,6 +471,15 @@ def main():
         metavar="CURRENT_DEPS",
         help="current dependencies list file",
     )
+    parser.add_argument(
+        "-b",
+        "--bundle",
+        action="store_true",
+        help="compare zenoss-py-deps bundles (tarballs, or directories "
+        "they were unpacked to) by the metadata of their wheels and "
+        "sdists, and show which top-level change pulled in each "
+        "transitive one",
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -159,12 +515,18 @@ def main():
         datefmt="%d-%m-%Y %H:%M:%S",
     )
 
-    # Load dependencies lists
-    previous_deps = parse_packages(options.previous)
-    current_deps = parse_packages(options.current)
+    if options.bundle:
+        # Load and compare dependencies of bundles
+        packages_difference = compare_bundles(
+            parse_bundle(options.previous), parse_bundle(options.current)
+        )
+    else:
+        # Load dependencies lists
+        previous_deps = parse_packages(options.previous)
+        current_deps = parse_packages(options.current)
 
-    # Compare dependencies lists
-    packages_difference = compare_packages(previous_deps, current_deps)
+        # Compare dependencies lists
+        packages_difference = compare_packages(previous_deps, current_deps)
 
     # Generate difference report
     difference_report = report_format(packages_difference)
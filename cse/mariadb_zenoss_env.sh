@@ -10,7 +10,7 @@ pip install virtualenv==16.7.9
 find $ZENHOME/lib/python2.7/ -type l -delete
 su - zenoss -c 'virtualenv $ZENHOME && virtualenv --relocatable $ZENHOME'
 su - zenoss -c 'mkdir $ZENHOME/zenpacks'
-su - zenoss -c 'cd $ZENHOME/install_scripts; ./artifact_download.py --zp_manifest zenpacks.json --out_dir ../zenpacks --reportFile zenpacks_artifact.log zenpack_versions.json'
+su - zenoss -c 'cd $ZENHOME/install_scripts; ./artifact_download.py --zp_manifest zenpacks.json --out_dir ../zenpacks --jobs 8 --reportFile zenpacks_artifact.log zenpack_versions.json'
 rm -rf $ZENHOME/local
 
 source ${ZENHOME}/install_scripts/rabbitmq_lib.sh
@@ -7,13 +7,19 @@ from github import Github
 from subprocess import call
 import json
 import re
-import urllib2
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import http_session
+
+# One keep-alive connection serves every ZenPack version lookup.
+session = http_session.Session()
 
 
 def get_latest_zp_version(zp_name):
     url = "http://zenpacks.zenoss.eng/requirement/%s" % zp_name
-    info = json.loads(urllib2.urlopen(url).read())
+    info = json.loads(session.get(url))
     return info['version']
 
 def get_latest_cz_release(org):
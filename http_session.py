@@ -0,0 +1,266 @@
+#!/usr/bin/env python2.7
+
+"""Shared HTTP client for the product-assembly tools.
+
+urllib2 opens a new TCP connection (and does a new DNS lookup) for every
+request.  The build tools talk to the same few hosts hundreds of times
+per build, so Session keeps a pool of persistent HTTP/1.1 connections for
+each host, applies one timeout to every socket operation and retries
+connection failures and 5xx responses with exponential backoff.
+
+A Session is safe to share between threads, and runConcurrently() runs
+requests (or anything else) on a small pool of them.
+"""
+
+import httplib
+import Queue
+import socket
+import sys
+import threading
+import time
+import urllib
+import urlparse
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+
+# Idle connections kept open per host.
+MAX_IDLE_PER_HOST = 8
+
+MAX_REDIRECTS = 5
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class HTTPError(Exception):
+    """The server answered with an error status."""
+
+    def __init__(self, url, code, reason):
+        super(HTTPError, self).__init__(url, code, reason)
+        self.url = url
+        self.code = code
+        self.reason = reason
+
+    def __str__(self):
+        return "HTTP Error %d: %s" % (self.code, self.reason)
+
+
+class ConnectionError(Exception):
+    """No response could be read from the server, even after retrying."""
+
+    def __init__(self, url, reason):
+        super(ConnectionError, self).__init__(url, reason)
+        self.url = url
+        self.reason = reason
+
+    def __str__(self):
+        return "Connection to %s failed: %s" % (self.url, self.reason)
+
+
+class Response(object):
+    """Body of a response, read from a pooled connection.
+
+    The connection goes back to its pool as soon as the body has been
+    read to the end; close() a response that is abandoned earlier.
+    """
+
+    def __init__(self, session, key, connection, response, url):
+        self._session = session
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self.url = url
+        self.code = response.status
+        self.reason = response.reason
+
+    def info(self):
+        return self._response.msg
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def read(self, amt=None):
+        data = self._response.read(amt)
+        if self._response.isclosed():
+            self.close()
+        return data
+
+    def close(self):
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        if self._response.isclosed() and not self._response.will_close:
+            self._session._release(self._key, connection)
+        else:
+            connection.close()
+
+
+class Session(object):
+    """Issues GET requests over per-host persistent connections."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _connectionKey(self, parsed):
+        proxy = None
+        if not urllib.proxy_bypass(parsed.hostname):
+            proxy = urllib.getproxies().get(parsed.scheme)
+        return parsed.scheme, parsed.hostname, parsed.port, proxy
+
+    def _connect(self, key):
+        scheme, host, port, proxy = key
+        connectionClass = httplib.HTTPSConnection if scheme == "https" else httplib.HTTPConnection
+        if not proxy:
+            return connectionClass(host, port, timeout=self.timeout)
+        proxyURL = urlparse.urlparse(proxy)
+        connection = connectionClass(proxyURL.hostname, proxyURL.port, timeout=self.timeout)
+        if scheme == "https":
+            connection.set_tunnel(host, port)
+        return connection
+
+    def _acquire(self, key):
+        """Return (connection, reused) for key."""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(key), False
+
+    def _release(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < MAX_IDLE_PER_HOST:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.itervalues():
+            for connection in connections:
+                connection.close()
+
+    def _request(self, url, headers):
+        """Send one GET and return (key, connection, response)."""
+        parsed = urlparse.urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError("unsupported URL: %s" % url)
+        key = self._connectionKey(parsed)
+        if key[3] and parsed.scheme == "http":
+            # Plain HTTP proxies are sent the absolute URL.
+            path = url
+        else:
+            path = urlparse.urlunparse(("", "", parsed.path or "/", parsed.params, parsed.query, ""))
+
+        while True:
+            connection, reused = self._acquire(key)
+            try:
+                connection.request("GET", path, headers=headers)
+                return key, connection, connection.getresponse()
+            except (socket.error, httplib.HTTPException):
+                connection.close()
+                # The server may have dropped an idle connection; only a
+                # failure on a new connection counts as a real one.
+                if not reused:
+                    raise
+
+    def open(self, url, headers=None):
+        """GET url and return a Response once its headers have arrived.
+
+        Redirects are followed.  Responses with a status below 400 (for
+        instance 206 or 304) are returned; 4xx and 5xx raise HTTPError.
+        """
+        headers = dict(headers or {})
+        redirects = 0
+        attempt = 0
+        while True:
+            try:
+                key, connection, response = self._request(url, headers)
+            except (socket.error, httplib.HTTPException) as e:
+                if attempt >= self.retries:
+                    raise ConnectionError(url, e)
+                attempt += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+                continue
+
+            result = Response(self, key, connection, response, url)
+            if response.status in REDIRECT_CODES and response.getheader("Location"):
+                result.read()
+                result.close()
+                redirects += 1
+                if redirects > MAX_REDIRECTS:
+                    raise HTTPError(url, response.status, "too many redirects")
+                url = urlparse.urljoin(url, response.getheader("Location"))
+                continue
+
+            if response.status >= 500 and attempt < self.retries:
+                result.read()
+                result.close()
+                attempt += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+                continue
+
+            if response.status >= 400:
+                result.read()
+                result.close()
+                raise HTTPError(url, response.status, response.reason)
+
+            return result
+
+    def get(self, url, headers=None):
+        """GET url and return the whole body."""
+        return self.open(url, headers).read()
+
+
+def runConcurrently(calls, jobs, name="worker"):
+    """Call every function in calls on a pool of at most jobs threads.
+
+    Returns the results in the order of calls, whichever finished first.
+    The first failure stops any call that has not started yet and is
+    re-raised once the calls already in flight have finished.
+    """
+    pending = Queue.Queue()
+    for index, call in enumerate(calls):
+        pending.put((index, call))
+
+    results = [None] * len(calls)
+    failures = []
+    abort = threading.Event()
+
+    def worker():
+        while not abort.is_set():
+            try:
+                index, call = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[index] = call()
+            except BaseException:
+                # Includes SystemExit, which would only end this thread.
+                failures.append(sys.exc_info())
+                abort.set()
+
+    workers = []
+    for n in range(min(max(jobs, 1), len(calls))):
+        thread = threading.Thread(target=worker, name="%s-%d" % (name, n))
+        thread.daemon = True
+        thread.start()
+        workers.append(thread)
+
+    # join() without a timeout blocks KeyboardInterrupt in python2
+    for thread in workers:
+        while thread.is_alive():
+            thread.join(1)
+
+    if failures:
+        excType, excValue, excTraceback = failures[0]
+        raise excType, excValue, excTraceback
+
+    return results
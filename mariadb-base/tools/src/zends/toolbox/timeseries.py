@@ -0,0 +1,297 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2026, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""Compact time series files and the samples they hold.
+
+A segment file starts with one line of JSON naming its columns, followed
+by fixed-size records: the sample time and one value per column, all
+little-endian doubles.  A rolling series is a directory of segments named
+after the epoch second their first sample falls in; segments older than
+the retention period are deleted as new ones are started, so a collector
+can run indefinitely in bounded space.
+
+In memory, samples are kept as Columns: one array of doubles per column.
+"""
+
+from __future__ import absolute_import
+
+import array
+import errno
+import json
+import math
+import os
+import struct
+import sys
+
+SEGMENT_SUFFIX = ".zts"
+SEGMENT_SECONDS = 3600
+FORMAT_NAME = "zends.toolbox.timeseries"
+FORMAT_VERSION = 1
+
+
+def record_struct(columns):
+    """Return the struct.Struct of a record with a value per column."""
+    return struct.Struct("<%dd" % (len(columns) + 1))
+
+
+def segment_paths(directory):
+    """Return the segment files in directory, oldest first."""
+    try:
+        names = os.listdir(directory)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return []
+        raise
+    starts = []
+    for name in names:
+        stem, suffix = os.path.splitext(name)
+        if suffix == SEGMENT_SUFFIX and stem.isdigit():
+            starts.append(int(stem))
+    return [
+        os.path.join(directory, "%d%s" % (start, SEGMENT_SUFFIX))
+        for start in sorted(starts)
+    ]
+
+
+def read_header(segment, path):
+    """Return the columns from the header of the open segment file."""
+    try:
+        header = json.loads(segment.readline())
+    except ValueError:
+        header = {}
+    if not isinstance(header, dict) or header.get("format") != FORMAT_NAME:
+        raise ValueError("%s is not a time series segment" % path)
+    return header["columns"]
+
+
+def read_segment(path):
+    """Return (columns, records) of the segment at path.
+
+    records yields (time, values) tuples.  A record cut short by a
+    collector that was killed while writing it is ignored.
+    """
+    segment = open(path, "rb")
+    try:
+        columns = read_header(segment, path)
+    except ValueError:
+        segment.close()
+        raise
+    record = record_struct(columns)
+
+    def records():
+        with segment:
+            while True:
+                data = segment.read(record.size)
+                if len(data) < record.size:
+                    return
+                row = record.unpack(data)
+                yield row[0], row[1:]
+
+    return columns, records()
+
+
+class RollingWriter(object):
+    """Appends samples to a series, one segment per segment_seconds."""
+
+    def __init__(
+        self,
+        directory,
+        columns,
+        retention=24 * 3600,
+        segment_seconds=SEGMENT_SECONDS,
+    ):
+        self.directory = directory
+        self.columns = list(columns)
+        self.retention = retention
+        self.segment_seconds = segment_seconds
+        self._record = record_struct(self.columns)
+        self._file = None
+        self._segment_start = None
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def append(self, timestamp, values):
+        segment_start = int(timestamp // self.segment_seconds) * (
+            self.segment_seconds
+        )
+        if segment_start != self._segment_start:
+            self._open_segment(segment_start)
+        self._file.write(self._record.pack(timestamp, *values))
+        self._file.flush()
+
+    def _open_segment(self, segment_start):
+        self.close()
+        path = os.path.join(
+            self.directory, "%d%s" % (segment_start, SEGMENT_SUFFIX)
+        )
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "r+b") as segment:
+                columns = read_header(segment, path)
+                if columns != self.columns:
+                    raise ValueError(
+                        "%s has columns %s, not %s"
+                        % (path, columns, self.columns)
+                    )
+                # Drop a record cut short by an earlier collector.
+                size = os.fstat(segment.fileno()).st_size
+                partial = (size - segment.tell()) % self._record.size
+                if partial:
+                    segment.truncate(size - partial)
+            self._file = open(path, "ab")
+        else:
+            self._file = open(path, "wb")
+            header = {
+                "format": FORMAT_NAME,
+                "version": FORMAT_VERSION,
+                "columns": self.columns,
+            }
+            self._file.write(json.dumps(header) + "\n")
+        self._segment_start = segment_start
+        self._expire(segment_start)
+
+    def _expire(self, now):
+        """Delete the segments that ended more than retention before now."""
+        for path in segment_paths(self.directory):
+            start = int(os.path.basename(path)[: -len(SEGMENT_SUFFIX)])
+            if start + self.segment_seconds > now - self.retention:
+                break
+            os.remove(path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._segment_start = None
+
+
+class Columns(object):
+    """Samples kept as one array of doubles per column, plus their times."""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.times = array.array("d")
+        self._values = [array.array("d") for _ in self.columns]
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, timestamp, values):
+        self.times.append(timestamp)
+        for column, value in zip(self._values, values):
+            column.append(value)
+
+    def column(self, name):
+        """Return the array of the values of column name."""
+        return self._values[self.columns.index(name)]
+
+    def _extend_from_records(self, data):
+        """Add the samples in data, a string of whole records."""
+        records = array.array("d")
+        records.fromstring(data)
+        if sys.byteorder != "little":
+            records.byteswap()
+        width = len(self.columns) + 1
+        self.times.extend(records[0::width])
+        for index, column in enumerate(self._values):
+            column.extend(records[index + 1::width])
+
+    def save(self, path):
+        """Write the samples to path as a single segment file."""
+        width = len(self.columns) + 1
+        records = array.array("d", [0.0]) * (len(self) * width)
+        records[0::width] = self.times
+        for index, column in enumerate(self._values):
+            records[index + 1::width] = column
+        if sys.byteorder != "little":
+            records.byteswap()
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as segment:
+            header = {
+                "format": FORMAT_NAME,
+                "version": FORMAT_VERSION,
+                "columns": self.columns,
+            }
+            segment.write(json.dumps(header) + "\n")
+            records.tofile(segment)
+        os.rename(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Return the samples of a segment file, or of a rolling series
+        directory, in time order."""
+        paths = segment_paths(path) if os.path.isdir(path) else [path]
+        if not paths:
+            raise ValueError("%s holds no time series segments" % path)
+        samples = None
+        for segment_path in paths:
+            with open(segment_path, "rb") as segment:
+                columns = read_header(segment, segment_path)
+                data = segment.read()
+            if samples is None:
+                samples = cls(columns)
+            elif columns != samples.columns:
+                raise ValueError(
+                    "%s has columns %s, not %s"
+                    % (segment_path, columns, samples.columns)
+                )
+            size = record_struct(columns).size
+            samples._extend_from_records(data[: len(data) - len(data) % size])
+        return samples
+
+
+def percentile(ordered, fraction):
+    """Return the fraction percentile of the sorted values in ordered,
+    interpolating between the two nearest ranks."""
+    if not ordered:
+        return float("nan")
+    position = (len(ordered) - 1) * fraction
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (
+        position - lower
+    )
+
+
+def trend(times, values):
+    """Return the least-squares slope of values over times, per second."""
+    points = [(t, v) for t, v in zip(times, values) if not math.isnan(v)]
+    if len(points) < 2:
+        return float("nan")
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    spread = sum((t - mean_t) ** 2 for t, _ in points)
+    if not spread:
+        return float("nan")
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / spread
+
+
+def summarize(samples, name):
+    """Return the statistics of column name of samples as a dict.
+
+    NaN values, such as the rate of a counter that was reset, are left
+    out.  "trend" is the least-squares slope per hour, and "rate" the net
+    change per second between the first and last sample.
+    """
+    values = samples.column(name)
+    ordered = sorted(v for v in values if not math.isnan(v))
+    summary = {
+        "count": len(ordered),
+        "min": ordered[0] if ordered else float("nan"),
+        "max": ordered[-1] if ordered else float("nan"),
+        "mean": sum(ordered) / len(ordered) if ordered else float("nan"),
+        "p50": percentile(ordered, 0.50),
+        "p95": percentile(ordered, 0.95),
+        "p99": percentile(ordered, 0.99),
+        "trend": trend(samples.times, values) * 3600,
+        "rate": float("nan"),
+    }
+    elapsed = samples.times[-1] - samples.times[0] if len(samples) else 0
+    if elapsed > 0:
+        summary["rate"] = (values[-1] - values[0]) / elapsed
+    return summary
@@ -19,11 +19,12 @@ import re
 import socket
 import string
 import sys
+import threading
 import time
 
-from collections import OrderedDict
 from logging.handlers import RotatingFileHandler
 
+from . import timeseries
 from .config import parse_global_conf
 
 scriptVersion = "2.0.0"
@@ -32,6 +33,39 @@ documentationURL = "https://support.zenoss.com/hc/en-us/articles/208050803"
 
 TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+# information_schema.global_status counters that --collect records as
+# per-second rates...
+COLLECTED_COUNTERS = [
+    "Innodb_rows_read",
+    "Innodb_rows_inserted",
+    "Innodb_rows_updated",
+    "Innodb_rows_deleted",
+    "Innodb_buffer_pool_read_requests",
+    "Innodb_buffer_pool_reads",
+    "Innodb_buffer_pool_write_requests",
+    "Innodb_buffer_pool_pages_flushed",
+    "Innodb_row_lock_waits",
+    "Innodb_row_lock_time",
+]
+
+# ...and the values it records as they are.
+COLLECTED_GAUGES = [
+    "Innodb_history_list_length",
+    "Threads_running",
+]
+
+# Results of each sample that are summarized, with their labels and the
+# type they are displayed as.
+SUMMARY_COLUMNS = [
+    ("history_list_length", "History List Length", int),
+    ("buffer_pool_used_percentage", "Bufferpool Used (%)", float),
+    ("number_active_transactions", "ACTIVE TRANSACTIONS", int),
+    ("number_active_transactions_over", "ACTIVE TRANS > 100s", int),
+]
+
+# A sample is kept as its start time and these values.
+SAMPLE_COLUMNS = ["end_time"] + [name for name, _, _ in SUMMARY_COLUMNS]
+
 
 def configure_logging(name, version, tmpdir):
     """Returns a python logging object for zenoss.toolbox tool usage"""
@@ -155,6 +189,49 @@ def parse_options(scriptVersion, description_string):
         type=int,
         help="gap between gathering subsequent datapoints",
     )
+    parser.add_argument(
+        "--collect",
+        action="store",
+        metavar="DIR",
+        help="keep sampling global status counters, writing their rates "
+        "to a rolling time series in DIR, until interrupted",
+    )
+    parser.add_argument(
+        "--interval",
+        action="store",
+        default=0.5,
+        type=float,
+        help="seconds between --collect samples, may be below 1",
+    )
+    parser.add_argument(
+        "--duration",
+        action="store",
+        default=0,
+        type=int,
+        help="seconds to --collect for, 0 to run until interrupted",
+    )
+    parser.add_argument(
+        "--retention",
+        action="store",
+        default=24,
+        type=int,
+        help="hours of --collect samples to keep on disk",
+    )
+    parser.add_argument(
+        "--save",
+        action="store",
+        metavar="DIR",
+        help="save the samples of each database to DIR/<database>%s"
+        % timeseries.SEGMENT_SUFFIX,
+    )
+    parser.add_argument(
+        "--replay",
+        action="store",
+        nargs="+",
+        metavar="PATH",
+        help="report percentiles, trends and rates of the samples saved "
+        "by --save or --collect in each PATH, without connecting to MySQL",
+    )
     parser.add_argument(
         "-l3",
         "--level3",
@@ -202,6 +279,44 @@ def connect_to_mysql(database_dict, log):
     return mysql_connection
 
 
+def get_connection(database_dict, log):
+    """Return the connection to database_dict, opening it on first use.
+
+    The connection is kept in database_dict and reused by every sample;
+    it is pinged first, which reconnects if the server has dropped it.
+    """
+    mysql_connection = database_dict.get("connection")
+    if mysql_connection is None:
+        mysql_connection = connect_to_mysql(database_dict, log)
+        database_dict["connection"] = mysql_connection
+        return mysql_connection
+    try:
+        mysql_connection.ping(reconnect=True)
+    except pymysql.Error as e:
+        log.warning(
+            "Lost connection to MySQL for database %s at %s: %s",
+            database_dict["prettyName"],
+            database_dict["host"],
+            e,
+        )
+        mysql_connection = connect_to_mysql(database_dict, log)
+        database_dict["connection"] = mysql_connection
+    return mysql_connection
+
+
+def close_connections(databases, log):
+    """Close the connections opened by get_connection."""
+    for database_dict in databases:
+        mysql_connection = database_dict.pop("connection", None)
+        if mysql_connection and mysql_connection.open:
+            mysql_connection.close()
+            log.info(
+                "Closed connection to MySQL for database %s at %s",
+                database_dict["prettyName"],
+                database_dict["host"],
+            )
+
+
 def parse_innodb_status(status, log):
     # INNODB: Grab data for "History list length"
     result = {}
@@ -274,6 +389,235 @@ def gather_MySQL_statistics(mysql_connection, log):
     return results_dict
 
 
+def gather_sample(database_dict, log):
+    """Return (start, end, results) of one sample of database_dict.
+
+    The sample starts once the connection is open, so that the time taken
+    to connect is not counted as part of it.
+    """
+    mysql_connection = get_connection(database_dict, log)
+    start_time = time.time()
+    mysql_results = gather_MySQL_statistics(mysql_connection, log)
+    return start_time, time.time(), mysql_results
+
+
+def gather_samples(databases, log, gather_one=gather_sample):
+    """Sample every database at the same time, one thread per database.
+
+    Returns the gather_one() result of each database, in order, so the
+    samples of one round are aligned in time however long each takes.
+    A failure in any thread is re-raised once all of them have finished.
+    """
+    if len(databases) == 1:
+        return [gather_one(databases[0], log)]
+
+    samples = [None] * len(databases)
+    failures = []
+
+    def gather(index, database_dict):
+        try:
+            samples[index] = gather_one(database_dict, log)
+        except BaseException:
+            # Includes the SystemExit of the gathering functions.
+            failures.append(sys.exc_info())
+
+    threads = [
+        threading.Thread(target=gather, args=(index, database_dict))
+        for index, database_dict in enumerate(databases)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        exc_type, exc_value, exc_traceback = failures[0]
+        raise exc_type, exc_value, exc_traceback
+    return samples
+
+
+_GlobalStatusSQL = """
+SELECT variable_name, variable_value
+FROM information_schema.global_status
+WHERE variable_name IN (%s)
+"""
+
+
+_HistoryLengthSQL = """
+SELECT count
+FROM information_schema.innodb_metrics
+WHERE name = 'trx_rseg_history_len'
+"""
+
+
+def gather_global_status(database_dict, log):
+    """Return (start, end, values) of the COLLECTED_COUNTERS and gauges.
+
+    Servers without an Innodb_history_list_length status variable report
+    the history length in innodb_metrics instead.  Any other variable the
+    server does not have is NaN.  As in gather_sample, the time taken to
+    connect is not part of the sample.
+    """
+    names = COLLECTED_COUNTERS + COLLECTED_GAUGES
+    mysql_connection = get_connection(database_dict, log)
+    start_time = time.time()
+    mysql_cursor = mysql_connection.cursor()
+    mysql_cursor.execute(
+        _GlobalStatusSQL % ", ".join(["%s"] * len(names)),
+        [name.upper() for name in names],
+    )
+    status = dict(
+        (name.lower(), float(value))
+        for name, value in mysql_cursor.fetchall()
+    )
+    if "innodb_history_list_length" not in status:
+        mysql_cursor.execute(_HistoryLengthSQL)
+        row = mysql_cursor.fetchone()
+        if row:
+            status["innodb_history_list_length"] = float(row[0])
+    mysql_cursor.close()
+    values = [status.get(name.lower(), float("nan")) for name in names]
+    return start_time, time.time(), values
+
+
+def collect_statistics(databases, cli_options, log):
+    """Write the rates of the global status counters of each database.
+
+    Each database gets a rolling time series in a subdirectory of the
+    --collect directory.  A sample is stamped with the middle of the time
+    its query took, and rates are taken between consecutive samples.  A
+    counter that went backwards, after a server restart, has no rate.
+    """
+    columns = [
+        "%s_per_sec" % name.lower() for name in COLLECTED_COUNTERS
+    ] + [name.lower() for name in COLLECTED_GAUGES]
+    counters = len(COLLECTED_COUNTERS)
+    history = counters + COLLECTED_GAUGES.index("Innodb_history_list_length")
+    writers = [
+        timeseries.RollingWriter(
+            os.path.join(cli_options["collect"], database_dict["name"]),
+            columns,
+            retention=cli_options["retention"] * 3600,
+        )
+        for database_dict in databases
+    ]
+    previous = [None] * len(databases)
+    interval = cli_options["interval"]
+    next_sample = time.time()
+    deadline = None
+    if cli_options["duration"]:
+        deadline = next_sample + cli_options["duration"]
+
+    print(
+        "[%s] Collecting MySQL global status every %ss into %s"
+        % (time.strftime(TIME_FORMAT), interval, cli_options["collect"])
+    )
+    try:
+        while deadline is None or next_sample < deadline:
+            samples = gather_samples(databases, log, gather_global_status)
+            status = []
+            for index, (start_time, end_time, values) in enumerate(samples):
+                timestamp = (start_time + end_time) / 2
+                if previous[index] is not None:
+                    last_timestamp, last_values = previous[index]
+                    elapsed = timestamp - last_timestamp
+                    rates = [
+                        (value - last) / elapsed if value >= last
+                        else float("nan")
+                        for value, last in zip(
+                            values[:counters], last_values[:counters]
+                        )
+                    ]
+                    writers[index].append(timestamp, rates + values[counters:])
+                previous[index] = (timestamp, values)
+                status.append(
+                    "%s history list length %g"
+                    % (databases[index]["name"], values[history])
+                )
+            inline_print(
+                "[%s] %s" % (time.strftime(TIME_FORMAT), ", ".join(status))
+            )
+            # Keep to the schedule without catching up in a burst.
+            next_sample = max(next_sample + interval, time.time())
+            time.sleep(max(0, next_sample - time.time()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for writer in writers:
+            writer.close()
+    print()
+
+
+def save_samples(databases, directory, log):
+    """Write the samples of each database to a file in directory."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for database_dict in databases:
+        path = os.path.join(
+            directory, database_dict["name"] + timeseries.SEGMENT_SUFFIX
+        )
+        database_dict["samples"].save(path)
+        log.info("Saved %d samples to %s", len(database_dict["samples"]), path)
+        print(
+            "[%s] Saved %s samples to %s"
+            % (time.strftime(TIME_FORMAT), database_dict["prettyName"], path)
+        )
+
+
+# Statistics shown by --replay, with their headings and formats.
+_ReplayStatistics = [
+    ("count", "count", "{:>8d}"),
+    ("p50", "p50", "{:>12.6g}"),
+    ("p95", "p95", "{:>12.6g}"),
+    ("p99", "p99", "{:>12.6g}"),
+    ("min", "min", "{:>12.6g}"),
+    ("max", "max", "{:>12.6g}"),
+    ("mean", "mean", "{:>12.6g}"),
+    ("trend", "trend/h", "{:>+12.6g}"),
+    ("rate", "rate/s", "{:>+12.6g}"),
+]
+
+
+def replay_samples(paths, log):
+    """Print the statistics of every column of the samples in paths.
+
+    A path is a file written by --save or a database directory written by
+    --collect.  trend is the change per hour fitted to all the samples,
+    and rate the net change per second from the first to the last one.
+    """
+    for path in paths:
+        try:
+            samples = timeseries.Columns.load(path)
+        except (IOError, OSError, ValueError) as e:
+            print("Cannot replay %s: %s" % (path, e))
+            log.error("Cannot replay %s: %s", path, e)
+            sys.exit(1)
+        if len(samples):
+            span = "%s to %s" % (
+                time.strftime(TIME_FORMAT, time.localtime(samples.times[0])),
+                time.strftime(TIME_FORMAT, time.localtime(samples.times[-1])),
+            )
+        else:
+            span = "no samples"
+        print("\n%s: %d samples, %s" % (path, len(samples), span))
+        log.info("Replaying %d samples from %s", len(samples), path)
+        columns = [name for name in samples.columns if name != "end_time"]
+        width = max([len("column")] + [len(name) for name in columns])
+        header = "{:<{}}".format("column", width) + "".join(
+            "{:>{}}".format(heading, 8 if key == "count" else 12)
+            for key, heading, _ in _ReplayStatistics
+        )
+        print(header)
+        log.info(header)
+        for name in columns:
+            summary = timeseries.summarize(samples, name)
+            line = "{:<{}}".format(name, width) + "".join(
+                spec.format(summary[key]) for key, _, spec in _ReplayStatistics
+            )
+            print(line)
+            log.info(line)
+    print()
+
+
 def log_MySQL_variables(mysql_connection, log):
     """Log the results of the 'SHOW VARIABLES' statement."""
     try:
@@ -305,6 +649,10 @@ def main():
     if cli_options["debug"]:
         log.setLevel(logging.DEBUG)
 
+    if cli_options["replay"]:
+        replay_samples(cli_options["replay"], log)
+        sys.exit(0)
+
     print(
         "\n[%s] Initializing %s v%s (detailed log at %s)" % (
             time.strftime("%Y-%m-%d %H:%M:%S"),
@@ -333,13 +681,14 @@ def main():
     # ZEN-19373: zencheckdbstats needs to take into account split databases
     databases_to_examine = []
     intermediate_dict = {
+        "name": "zodb",
         "prettyName": "'zodb' Database",
         "host": global_conf_dict["zodb-host"],
         "port": global_conf_dict["zodb-port"],
         "user": global_conf_dict["zodb-user"],
         "password": global_conf_dict["zodb-password"],
         "database": global_conf_dict["zodb-db"],
-        "mysql_results_list": [],
+        "samples": timeseries.Columns(SAMPLE_COLUMNS),
     }
     if global_conf_dict["zodb-host"] == "localhost":
         if "zodb-socket" in global_conf_dict:
@@ -347,13 +696,14 @@ def main():
     databases_to_examine.append(intermediate_dict)
     if global_conf_dict["zodb-host"] != global_conf_dict["zep-host"]:
         intermediate_dict = {
+            "name": "zenoss_zep",
             "prettyName": "'zenoss_zep' Database",
             "host": global_conf_dict["zep-host"],
             "port": global_conf_dict["zep-port"],
             "user": global_conf_dict["zep-user"],
             "password": global_conf_dict["zep-password"],
             "database": global_conf_dict["zep-db"],
-            "mysql_results_list": [],
+            "samples": timeseries.Columns(SAMPLE_COLUMNS),
         }
         if global_conf_dict["zep-host"] == "localhost":
             # No zep-socket param, use zodb-socket
@@ -366,43 +716,43 @@ def main():
     if cli_options["debug"]:
         try:
             for item in databases_to_examine:
-                mysql_connection = connect_to_mysql(item, log)
+                mysql_connection = get_connection(item, log)
                 log_MySQL_variables(mysql_connection, log)
-                if mysql_connection:
-                    mysql_connection.close()
-                    log.info(
-                        "Closed connection to MySQL for database %s at %s",
-                        item["prettyName"],
-                        item["host"],
-                    )
         except Exception as e:
             print("Exception encountered: ", e)
             log.exception("Failure: %s", e)
             exit(1)
 
+    if cli_options["collect"]:
+        collect_statistics(databases_to_examine, cli_options, log)
+        close_connections(databases_to_examine, log)
+        log.info(
+            "zencheckdbstats collected for %1.2f seconds",
+            time.time() - execution_start,
+        )
+        log.info(
+            "############################################################"
+        )
+        sys.exit(0)
+
     sample_count = 0
 
     while sample_count < cli_options["times"]:
         sample_count += 1
-        current_time = time.time()
         inline_print(
             "[%s] Gathering MySQL metrics... (%d/%d)"
             % (time.strftime(TIME_FORMAT), sample_count, cli_options["times"])
         )
         try:
-            for item in databases_to_examine:
-                mysql_connection = connect_to_mysql(item, log)
-                mysql_results = gather_MySQL_statistics(mysql_connection, log)
-                item["mysql_results_list"].append(
-                    (current_time, mysql_results)
+            samples = gather_samples(databases_to_examine, log)
+            for item, (start_time, end_time, results) in zip(
+                databases_to_examine, samples
+            ):
+                item["samples"].append(
+                    start_time,
+                    [end_time]
+                    + [results[name] for name, _, _ in SUMMARY_COLUMNS],
                 )
-                if mysql_connection:
-                    mysql_connection.close()
-                    log.info(
-                        "Closed connection to MySQL for database %s at %s",
-                        item["prettyName"],
-                        item["host"],
-                    )
         except Exception as e:
             print("Exception encountered: ", e)
             log.exception("Failure: %s", e)
@@ -410,6 +760,11 @@ def main():
         if sample_count < cli_options["times"]:
             time.sleep(cli_options["gap"])
 
+    close_connections(databases_to_examine, log)
+
+    if cli_options["save"]:
+        save_samples(databases_to_examine, cli_options["save"], log)
+
     # Process and display results (calculate statistics)
     print()
     for database in databases_to_examine:
@@ -422,25 +777,10 @@ def main():
             time.strftime(TIME_FORMAT),
             database["prettyName"],
         )
-        observed_results_dict = OrderedDict([])
-        observed_results_dict["History List Length"] = [
-            item[1]["history_list_length"]
-            for item in database["mysql_results_list"]
-        ]
-        observed_results_dict["Bufferpool Used (%)"] = [
-            item[1]["buffer_pool_used_percentage"]
-            for item in database["mysql_results_list"]
-        ]
-        observed_results_dict["ACTIVE TRANSACTIONS"] = [
-            item[1]["number_active_transactions"]
-            for item in database["mysql_results_list"]
-        ]
-        observed_results_dict["ACTIVE TRANS > 100s"] = [
-            item[1]["number_active_transactions_over"]
-            for item in database["mysql_results_list"]
-        ]
-        for key in observed_results_dict:
-            values = observed_results_dict[key]
+        for name, key, kind in SUMMARY_COLUMNS:
+            values = [
+                kind(value) for value in database["samples"].column(name)
+            ]
             if min(values) != max(values):
                 output_message = (
                     "[{}]  {}: {:<10} (Average {:.2f}, Minimum {}, Maximum {})"
@@ -448,7 +788,7 @@ def main():
                     time.strftime(TIME_FORMAT),
                     key,
                     values[-1],
-                    float(sum(values) / len(values)),
+                    sum(values) / float(len(values)),
                     min(values),
                     max(values),
                 )
@@ -194,7 +194,30 @@ install_zenpacks() {
 		   LINK_INSTALL="--link"
 		   ZENPACK_BLACKLIST="${ZENHOME}/install_scripts/zp_blacklist.json"
 		fi
-		local cmd="${ZENHOME}/install_scripts/zp_install.py ${ZENHOME}/install_scripts/zenpacks.json ${ZENHOME}/packs ${ZENPACK_BLACKLIST} ${LINK_INSTALL}"
+		# The artifact report gives the dependencies between the zenpacks;
+		# ZENPACK_INSTALL_BATCH installs them all in one Zope process,
+		# committing every ZENPACK_COMMIT_EVERY zenpacks.
+		local install_mode=""
+		if [ -n "${ZENPACK_INSTALL_BATCH}" ]; then
+		   install_mode="--batch --commit-every ${ZENPACK_COMMIT_EVERY:-1}"
+		fi
+		# The time and memory each zenpack took to install are written next
+		# to the artifact report; the zenpacks named in ZENPACK_PROFILE are
+		# installed under cProfile.
+		local instrument="--timing-report ${ZENHOME}/log/zenpacks_install_timing.json"
+		if [ -n "${ZENPACK_PROFILE}" ]; then
+		   instrument="${instrument} --profile-dir ${ZENHOME}/log/zenpack_profiles"
+		   for zenpack in ${ZENPACK_PROFILE}; do
+		      instrument="${instrument} --profile ${zenpack}"
+		   done
+		fi
+		# Installed zenpacks are journaled, so that a failed install can be
+		# rerun with ZENPACK_INSTALL_RESUME set to only install the rest.
+		local checkpoint="--checkpoint ${ZENHOME}/log/zenpacks_install_checkpoint.jsonl"
+		if [ -n "${ZENPACK_INSTALL_RESUME}" ]; then
+		   checkpoint="${checkpoint} --resume"
+		fi
+		local cmd="${ZENHOME}/install_scripts/zp_install.py --report ${ZENHOME}/log/zenpacks_artifact.log ${install_mode} ${instrument} ${checkpoint} ${ZENHOME}/install_scripts/zenpacks.json ${ZENHOME}/packs ${ZENPACK_BLACKLIST} ${LINK_INSTALL}"
 		if [[ $EUID -eq 0 ]]; then
 			cmd="su - zenoss -c \"${cmd}\""
 		fi
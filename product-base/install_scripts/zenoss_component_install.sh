@@ -12,102 +12,109 @@ function run
 	su - zenoss -c "$@"
 }
 
-function download_artifact
+REPORT_FILE=${ZENHOME}/log/zenoss_component_artifact.log
+
+COMPONENTS=(
+    zenoss-py-deps
+    zenoss-prodbin
+    zensocket
+    zenoss.metric.consumer
+    query
+    zenoss-protocols
+    pynetsnmp
+    zenoss-extjs
+    zenoss-zep
+    metricshipper
+    zminion
+    redis-mon
+    zproxy
+    zenoss.toolbox
+    service-migration
+    solr-image
+    modelindex
+)
+
+PYDEPS_DIR=/tmp/python_dependencies
+
+# Tarballs unpacked by artifact_download.py while they download.  The ones
+# unpacked into ${ZENHOME} are unpacked one after the other, in the order
+# of COMPONENTS, so that a file shipped by more than one of them always
+# ends up from the same component.
+EXTRACT=(
+    zenoss-py-deps=${PYDEPS_DIR}:1
+    zenoss-prodbin=${ZENHOME}
+    zensocket=${ZENHOME}
+    zenoss.metric.consumer=${ZENHOME}
+    query=${ZENHOME}
+    zenoss-zep=${ZENHOME}
+    metricshipper=${ZENHOME}
+    zminion=${ZENHOME}
+    redis-mon=${ZENHOME}
+    zproxy=${ZENHOME}:2
+    modelindex=/tmp/modelindex
+)
+
+# Print the file unpacked from the tarball /tmp/$1* whose path ends in $2,
+# from the manifest artifact_download.py wrote for the tarball.
+function extracted_file
 {
-    local artifact="$@"
-    run "${ZENHOME}/install_scripts/artifact_download.py --out_dir /tmp --reportFile ${ZENHOME}/log/zenoss_component_artifact.log ${ZENHOME}/install_scripts/component_versions.json ${artifact}"
+    grep -m 1 -- "$2\$" /tmp/.$1*.manifest
 }
 
+# Download every component in one run, in parallel, before installing any
+# of them.  The report itself is written once, after the install.
+echo "Downloading Zenoss components..."
+run "${ZENHOME}/install_scripts/artifact_download.py --out_dir /tmp --jobs 8 ${EXTRACT[*]/#/--extract } --reportFile ${REPORT_FILE} --defer-report ${ZENHOME}/install_scripts/component_versions.json ${COMPONENTS[*]}"
+
 PIP_INSTALL="pip --no-python-version-warning install --no-index"
 
 # Install pydeps
 echo "Installing Zenoss Python dependencies..."
-download_artifact "zenoss-py-deps"
-PYDEPS_DIR=/tmp/python_dependencies
-run "mkdir ${PYDEPS_DIR}"
-run "tar -C ${PYDEPS_DIR} --strip-components=1 -xf /tmp/pydeps*"
 run "cd ${PYDEPS_DIR}; ./install.sh"
 
 # Configure Zope's INSTANCE_HOME
 run "echo \"export INSTANCE_HOME=/opt/zenoss\" >> ~/.bashrc"
 
-# Install Prodbin
-download_artifact "zenoss-prodbin"
-run "tar -C ${ZENHOME} -xzvf /tmp/prodbin*"
+# Prodbin, zensocket, MetricConsumer and CentralQuery were unpacked into
+# ${ZENHOME} by artifact_download.py.
 
 # TODO: remove this and make sure the tar file contains the proper links
 run "mkdir -p ${ZENHOME}/etc/supervisor ${ZENHOME}/var/zauth ${ZENHOME}/libexec ${ZENHOME}/lib/python"
-run "ln -s ${ZENHOME}/etc/zauth/zauth_supervisor.conf ${ZENHOME}/etc/supervisor/zauth_supervisor.conf"
-
-# Install zensocket
-download_artifact "zensocket"
-run "tar -C ${ZENHOME} -xzvf /tmp/zensocket*"
+run "ln -s $(extracted_file prodbin /zauth/zauth_supervisor.conf) ${ZENHOME}/etc/supervisor/zauth_supervisor.conf"
 
-# Install MetricConsumer
-download_artifact "zenoss.metric.consumer"
-run "tar -C ${ZENHOME} -xzvf /tmp/metric-consumer*"
 # TODO: remove this and make sure files marked as executable in tar file
-run "chmod +x ${ZENHOME}/bin/metric-consumer-app.sh"
+run "chmod +x $(extracted_file metric-consumer /bin/metric-consumer-app.sh)"
 # TODO: remove this and make sure the tar file contains the proper links
-run "ln -s ${ZENHOME}/etc/metric-consumer-app/metric-consumer-app_supervisor.conf ${ZENHOME}/etc/supervisor/metric-consumer-app_supervisor.conf"
+run "ln -s $(extracted_file metric-consumer /metric-consumer-app_supervisor.conf) ${ZENHOME}/etc/supervisor/metric-consumer-app_supervisor.conf"
 
-# Install CentralQuery
-download_artifact "query"
-run "tar -C ${ZENHOME} -xzvf /tmp/central-query*"
 # TODO: remove this and make sure files marked as executable in tar file
-run "chmod +x ${ZENHOME}/bin/central-query.sh"
+run "chmod +x $(extracted_file central-query /bin/central-query.sh)"
 # TODO: remove this and make sure the tar file contains the proper links
-run "ln -s ${ZENHOME}/etc/central-query/central-query_supervisor.conf ${ZENHOME}/etc/supervisor/central-query_supervisor.conf"
+run "ln -s $(extracted_file central-query /central-query_supervisor.conf) ${ZENHOME}/etc/supervisor/central-query_supervisor.conf"
 
 # Install zenoss-protocols
-download_artifact "zenoss-protocols"
 run "${PIP_INSTALL} /tmp/zenoss.protocols*.whl"
 
 # Install pynetsnmp
-download_artifact "pynetsnmp"
 run "${PIP_INSTALL} /tmp/pynetsnmp*.whl"
 
 # Install zenoss-extjs
-download_artifact "zenoss-extjs"
 run "${PIP_INSTALL} /tmp/zenoss.extjs*"
 
-# Install zep
-download_artifact "zenoss-zep"
-run "tar -C ${ZENHOME} -xzvf /tmp/zep-dist*"
-
-# Install metricshipper
-download_artifact "metricshipper"
-run "tar -C ${ZENHOME} -xzvf /tmp/metricshipper*"
-
-# Install zminion
-download_artifact "zminion"
-run "tar -C ${ZENHOME} -xzvf /tmp/zminion*"
-
-# Install redis-mon
-download_artifact "redis-mon"
-run "tar -C ${ZENHOME} -xzvf /tmp/redis-mon*"
-
-# Install zproxy
-download_artifact "zproxy"
-run "tar --strip-components=2 -C ${ZENHOME} -xzvf /tmp/zproxy*"
+# zep, metricshipper, zminion, redis-mon and zproxy were unpacked into
+# ${ZENHOME} by artifact_download.py.
 
 # Install zenoss.toolobx
-download_artifact "zenoss.toolbox"
 run "${PIP_INSTALL} /tmp/zenoss.toolbox*.whl"
 
 # Install the service migration SDK
-download_artifact "service-migration"
 run "${PIP_INSTALL} /tmp/servicemigration*"
 
 # Install zenoss-solr
-download_artifact "solr-image"
 tar -C / -xzvf /tmp/zenoss-solr*
 chown -R zenoss:zenoss /var/solr
 
 # Install Modelindex
-download_artifact "modelindex"
-run "mkdir /tmp/modelindex"
-run "tar -C /tmp/modelindex -xzvf /tmp/modelindex-*"
 run "${PIP_INSTALL} /tmp/modelindex/dist/zenoss.modelindex*"
 # Copy the modelindex configsets into solr for bootstrapping.
 #  TODO:  when we move to external zookeeper for solr, do something else
@@ -129,5 +136,7 @@ echo "Cleaning up after install..."
 find ${ZENHOME} -name \*.py[co] -delete
 /sbin/scrub.sh
 
+run "${ZENHOME}/install_scripts/artifact_download.py --reportFile ${REPORT_FILE} --render-report ${ZENHOME}/install_scripts/component_versions.json"
+
 echo "Component Artifact Report"
-cat ${ZENHOME}/log/zenoss_component_artifact.log
+cat ${REPORT_FILE}
@@ -1,10 +1,373 @@
 #!/usr/bin/env python
 import argparse
-import fnmatch
+import hashlib
 import json
 import os
+import re
 import subprocess
 import sys
+import time
+
+# The project name at the start of a requirement such as "ZenPacks.zenoss.Foo>=1.5"
+_requirement_name = re.compile(r"^\s*([A-Za-z0-9_.\-]+)")
+
+
+def loadReport(reportFile):
+    """Return the artifact entries of the zenpacks_artifact.log report.
+
+    The report is written by artifact_download.py and records what the
+    zenpacks endpoint returned for each pack.  An unreadable report, such
+    as the placeholder written for devimg link installs, has no entries.
+    """
+    try:
+        with open(reportFile) as f:
+            return json.load(f)
+    except (IOError, ValueError) as e:
+        print "Cannot read ZenPack artifact report %s: %s" % (reportFile, e)
+        return []
+
+
+def loadRequires(report):
+    """Return {zpName: [required zpName, ...]} from an artifact report."""
+    requires = {}
+    for artifact in report:
+        zenpack = artifact.get("zenpack") or {}
+        names = []
+        for requirement in zenpack.get("requires") or []:
+            match = _requirement_name.match(requirement)
+            if match:
+                names.append(match.group(1))
+        requires[artifact["name"]] = names
+    return requires
+
+
+def dependencyGraph(zpNames, requires):
+    """Return {zpName: set of zpNames it must be installed after}.
+
+    Only dependencies on packs in zpNames count; anything else is either
+    installed already or not installed at all.  A dependency on a pack
+    that comes later in zpNames is ignored, so packs are never installed
+    in an order the manifest does not allow.
+    """
+    position = dict((zpName, i) for i, zpName in enumerate(zpNames))
+    graph = {}
+    for zpName in zpNames:
+        graph[zpName] = set()
+        for dependency in requires.get(zpName, []):
+            if dependency not in position or dependency == zpName:
+                continue
+            if position[dependency] > position[zpName]:
+                print "Warning: ZenPack %s requires %s, which the manifest installs after it" % (
+                    zpName, dependency)
+                continue
+            graph[zpName].add(dependency)
+    return graph
+
+
+def criticalPath(zpNames, graph, durations):
+    """Return the chain of dependent packs with the longest total duration.
+
+    Packs without a duration count as taking no time.
+    """
+    finish = {}
+    previous = {}
+    for zpName in zpNames:
+        start = 0.0
+        if graph[zpName]:
+            previous[zpName] = max(sorted(graph[zpName]), key=lambda name: finish[name])
+            start = finish[previous[zpName]]
+        finish[zpName] = start + durations.get(zpName, 0.0)
+    if not finish:
+        return []
+    zpName = max(zpNames, key=lambda name: finish[name])
+    path = [zpName]
+    while path[-1] in previous:
+        path.append(previous[path[-1]])
+    path.reverse()
+    return path
+
+
+def splitZenPackFileName(fileName):
+    """Return (zpName, version) of an egg name like Name-1.0-py2.7.egg."""
+    zpName, _, rest = fileName.partition("-")
+    if not rest:
+        return None, None
+    version = rest[:-len(".egg")] if rest.endswith(".egg") else rest
+    return zpName, version.split("-py")[0]
+
+
+def indexZenPackDir(zpDir, link):
+    """Return {zpName: [(version, fileName), ...]} for the files in zpDir.
+
+    Link installs use source directories named exactly after the pack,
+    which have no version.
+    """
+    index = {}
+    for fileName in os.listdir(zpDir):
+        if fileName.startswith("."):
+            continue
+        if link:
+            zpName, version = fileName, None
+        else:
+            zpName, version = splitZenPackFileName(fileName)
+            if zpName is None:
+                continue
+        index.setdefault(zpName, []).append((version, fileName))
+    return index
+
+
+def indexReport(report):
+    """Return {zpName: [(version, fileName), ...]} of the packs in report."""
+    index = {}
+    for artifact in report:
+        zenpack = artifact.get("zenpack") or {}
+        if "url" in zenpack:
+            index.setdefault(artifact["name"], []).append(
+                (zenpack.get("version"), os.path.basename(zenpack["url"])))
+    return index
+
+
+def findZenPackFiles(zpNames, index, zpDir):
+    """Return {zpName: path} for every pack, or raise listing every problem."""
+    zpFiles = {}
+    errors = []
+    for zpName in zpNames:
+        matches = index.get(zpName, [])
+        if not matches:
+            errors.append("zenpack file not found for zenpack: %s" % zpName)
+        elif len(matches) != 1:
+            errors.append("Found multiple files for zenpack: %s (%s)" % (
+                zpName, ", ".join("%s in %s" % match for match in sorted(matches))))
+        else:
+            zpFiles[zpName] = os.path.join(zpDir, matches[0][1])
+            if not os.path.exists(zpFiles[zpName]):
+                errors.append("zenpack file %s not found for zenpack: %s" % (zpFiles[zpName], zpName))
+    if errors:
+        raise Exception("\n".join(errors))
+    return zpFiles
+
+
+def fileChecksum(path):
+    """Return the sha1 of the file at path, or None for a link source directory."""
+    if os.path.isdir(path):
+        return None
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), ""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def listInstalledZenPacks():
+    """Return the names of the packs zenpack --list reports as installed."""
+    output = subprocess.check_output(["zenpack", "--list"], env=os.environ)
+    return set(line.split()[0] for line in output.splitlines() if line.startswith("ZenPacks."))
+
+
+class Checkpoint(object):
+    """Journal of the packs that installed successfully, for --resume.
+
+    Each line is a JSON object with the "name" of a pack and the "file"
+    and "sha1" it was installed from; a later line for a pack replaces an
+    earlier one.  Lines are written as soon as the install is durable.
+    """
+
+    def __init__(self, path, resume):
+        self.path = path
+        self.installed = {}
+        if not resume:
+            open(path, "w").close()
+            return
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by the failure being resumed.
+                        continue
+                    self.installed[entry["name"]] = entry
+        except IOError:
+            pass
+
+    def matches(self, zpName, zpFile):
+        """Return True if zpName was installed from the same content as zpFile."""
+        entry = self.installed.get(zpName)
+        return entry is not None and entry["sha1"] == fileChecksum(zpFile)
+
+    def record(self, zpName, zpFile):
+        entry = {"name": zpName, "file": zpFile, "sha1": fileChecksum(zpFile)}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry, sort_keys=True) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.installed[zpName] = entry
+
+
+def printInstalling(zpName, zpFile, link):
+    if link:
+        print "Installing zenpack in link mode: %s %s" % (zpName, zpFile)
+    else:
+        print "Installing zenpack: %s %s" % (zpName, zpFile)
+    sys.stdout.flush()
+
+
+def installCommand(zpName, zpFile, link, profile=None):
+    """Return the command installing zpFile, under cProfile if profile is set."""
+    cmd = ["zenpack", "--install", zpFile]
+    if profile:
+        cmd = [sys.executable, "-m", "cProfile", "-o", profile, zenPackCmdScript(), "--install", zpFile]
+    if link:
+        cmd.append("--link")
+    printInstalling(zpName, zpFile, link)
+    return cmd
+
+
+def zenPackCmdScript():
+    """Return the script the zenpack command runs, to run it under cProfile."""
+    from Products.ZenUtils import ZenPackCmd
+    return os.path.splitext(ZenPackCmd.__file__)[0] + ".py"
+
+
+def profilePath(zpName, args):
+    """Return where to save the profile of zpName, or None to not profile it."""
+    if zpName not in (args.profile or []):
+        return None
+    return os.path.join(args.profile_dir, "%s.prof" % zpName)
+
+
+def exitStatus(status):
+    """Return the Popen.returncode for a status returned by os.wait4()."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def processTiming(zpName, zpFile, start, status, rusage, profile):
+    """Return the timing record of a finished zenpack --install process."""
+    timing = {
+        "name": zpName,
+        "file": zpFile,
+        "status": "installed" if status == 0 else "failed",
+        "exit_status": status,
+        "wall_time": time.time() - start,
+        "user_time": rusage.ru_utime,
+        "system_time": rusage.ru_stime,
+        "cpu_time": rusage.ru_utime + rusage.ru_stime,
+        "max_rss_kb": rusage.ru_maxrss,
+    }
+    if profile:
+        timing["profile"] = profile
+    return timing
+
+
+def installSerially(zpNames, zpFiles, args, timings, checkpoint):
+    for zpName in zpNames:
+        profile = profilePath(zpName, args)
+        cmd = installCommand(zpName, zpFiles[zpName], args.link, profile)
+        start = time.time()
+        process = subprocess.Popen(cmd, env=os.environ)
+        # wait4() also gives the resource usage of the install.
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = exitStatus(status)
+        timings[zpName] = processTiming(zpName, zpFiles[zpName], start, process.returncode, rusage, profile)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd)
+        if checkpoint:
+            checkpoint.record(zpName, zpFiles[zpName])
+
+
+def installBatch(zpNames, zpFiles, args, timings, checkpoint):
+    """Install every pack in this process, loading Zope only once.
+
+    The packs are committed in groups of args.commit_every.  A failure
+    aborts the group it is in, reports which packs were rolled back, and
+    is raised; the groups before it stay committed.
+
+    The max_rss_kb of each pack is the peak of the whole process so far.
+    """
+    # Only the batch mode runs inside Zope.
+    import cProfile
+    import resource
+    import transaction
+    from Products.ZenUtils.ZenPackCmd import InstallEggAndZenPack
+    from Products.ZenUtils.ZenScriptBase import ZenScriptBase
+
+    dmd = ZenScriptBase(connect=True, noopts=True).dmd
+    uncommitted = []
+    for zpName in zpNames:
+        profile = profilePath(zpName, args)
+        printInstalling(zpName, zpFiles[zpName], args.link)
+        profiler = cProfile.Profile() if profile else None
+        before = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.time()
+        timing = timings[zpName] = {
+            "name": zpName,
+            "file": zpFiles[zpName],
+            "status": "failed",
+        }
+        try:
+            if profiler:
+                profiler.runcall(InstallEggAndZenPack, dmd, zpFiles[zpName], link=args.link)
+            else:
+                InstallEggAndZenPack(dmd, zpFiles[zpName], link=args.link)
+            timing["status"] = "installed"
+        finally:
+            after = resource.getrusage(resource.RUSAGE_SELF)
+            timing.update(
+                wall_time=time.time() - start,
+                user_time=after.ru_utime - before.ru_utime,
+                system_time=after.ru_stime - before.ru_stime,
+                max_rss_kb=after.ru_maxrss,
+            )
+            timing["cpu_time"] = timing["user_time"] + timing["system_time"]
+            if profiler:
+                profiler.dump_stats(profile)
+                timing["profile"] = profile
+            if timing["status"] != "installed":
+                transaction.abort()
+                print "Failed to install zenpack %s" % zpName
+                if uncommitted:
+                    print "Rolled back zenpacks: %s" % ", ".join(uncommitted)
+                sys.stdout.flush()
+        print "Installed zenpack %s in %.1fs" % (zpName, timing["wall_time"])
+        uncommitted.append(zpName)
+        if len(uncommitted) >= args.commit_every:
+            commitBatch(transaction, uncommitted, zpFiles, checkpoint)
+            uncommitted = []
+        sys.stdout.flush()
+    if uncommitted:
+        commitBatch(transaction, uncommitted, zpFiles, checkpoint)
+
+
+def commitBatch(transaction, zpNames, zpFiles, checkpoint):
+    transaction.commit()
+    if checkpoint:
+        for zpName in zpNames:
+            checkpoint.record(zpName, zpFiles[zpName])
+
+
+def reportCriticalPath(zpNames, graph, durations, elapsed):
+    path = criticalPath(zpNames, graph, durations)
+    if not path:
+        return path
+    pathTime = sum(durations.get(zpName, 0.0) for zpName in path)
+    print "%d ZenPack installs took %.1fs (%.1fs in total), critical path %.1fs:" % (
+        len(durations), elapsed, sum(durations.values()), pathTime)
+    for zpName in path:
+        print "    %s (%.1fs)" % (zpName, durations.get(zpName, 0.0))
+    return path
+
+
+def writeTimingReport(path, zpNames, timings, criticalPath, elapsed):
+    """Write the timing of every install attempted, in install order."""
+    report = {
+        "elapsed": elapsed,
+        "critical_path": criticalPath,
+        "zenpacks": [timings[zpName] for zpName in zpNames if zpName in timings],
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4, sort_keys=True, separators=(",", ": "))
 
 
 def main(args):
@@ -16,34 +379,56 @@ def main(args):
         with open(args.zp_blacklist) as blacklistFile:
             blacklist = json.load(blacklistFile)
 
+    zpNames = []
     for zpName in manifest["install_order"]:
         if zpName in blacklist:
             print "Skipping blacklisted ZenPack %s" % zpName
             continue
+        zpNames.append(zpName)
+
+    report = loadReport(args.report) if args.report else []
+    requires = loadRequires(report)
+
+    # Find the file of every pack before installing any of them, so that a
+    # bad manifest fails at once rather than part way through the install.
+    if args.index == "report":
+        index = indexReport(report)
+    else:
+        index = indexZenPackDir(args.zpDir, args.link)
+    zpFiles = findZenPackFiles(zpNames, index, args.zpDir)
 
-        zpGlob = "%s-*" % zpName
-        if args.link:
-            # exact match for link install
-            zpGlob = zpName
-        dirList = os.listdir(args.zpDir)
-        zpFileName = fnmatch.filter(dirList, zpGlob)
-        if not zpFileName:
-            raise Exception("zenpack file not found for zenpack: %s" % zpName)
-        elif len(zpFileName) != 1:
-            raise Exception("Found multiple files for zenpack: %s" % zpName)
+    checkpoint = None
+    if args.checkpoint:
+        checkpoint = Checkpoint(args.checkpoint, args.resume)
+    if args.resume:
+        # A pack is only skipped if it is still installed, from the same file.
+        installed = listInstalledZenPacks()
+        remaining = []
+        for zpName in zpNames:
+            if zpName in installed and checkpoint.matches(zpName, zpFiles[zpName]):
+                print "Skipping ZenPack %s, already installed from %s" % (zpName, zpFiles[zpName])
+                continue
+            remaining.append(zpName)
+        zpNames = remaining
+
+    graph = dependencyGraph(zpNames, requires)
+
+    if args.profile and not os.path.isdir(args.profile_dir):
+        os.makedirs(args.profile_dir)
+
+    timings = {}
+    start = time.time()
+    try:
+        if args.batch:
+            installBatch(zpNames, zpFiles, args, timings, checkpoint)
         else:
-            zpFile = os.path.join(args.zpDir, zpFileName[0])
-            cmd = ["zenpack", "--install", zpFile]
-            if args.link:
-                print "Installing zenpack in link mode: %s %s" % (
-                    zpName,
-                    zpFile,
-                )
-                cmd.append("--link")
-            else:
-                print "Installing zenpack: %s %s" % (zpName, zpFile)
-            sys.stdout.flush()
-            subprocess.check_call(cmd, env=os.environ)
+            installSerially(zpNames, zpFiles, args, timings, checkpoint)
+    finally:
+        elapsed = time.time() - start
+        durations = dict((zpName, timing["wall_time"]) for zpName, timing in timings.iteritems())
+        path = reportCriticalPath(zpNames, graph, durations, elapsed)
+        if args.timing_report:
+            writeTimingReport(args.timing_report, zpNames, timings, path, elapsed)
 
 
 if __name__ == "__main__":
@@ -65,6 +450,61 @@ if __name__ == "__main__":
     parser.add_argument(
         "--link", action="store_true", help="link-install the zenpacks"
     )
+    parser.add_argument(
+        "--report",
+        type=str,
+        help="artifact report of the downloaded zenpacks, whose requires "
+        "lists give the dependencies between them",
+    )
+    parser.add_argument(
+        "--index",
+        choices=["dir", "report"],
+        default="dir",
+        help="find each zenpack's file by listing zpDir, or by the download "
+        "url recorded in --report, defaults to dir",
+    )
+    parser.add_argument(
+        "--timing-report",
+        type=str,
+        help="json file to write the wall time, cpu time, peak memory and "
+        "status of each zenpack install to",
+    )
+    parser.add_argument(
+        "--profile",
+        action="append",
+        metavar="ZENPACK",
+        help="run the install of this zenpack under cProfile; may be repeated",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=str,
+        default=".",
+        help="directory to save the --profile stats to, defaults to pwd",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        help="journal to record each zenpack in once it is installed",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the zenpacks the --checkpoint journal records as "
+        "installed from the same file, if they are still installed",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="install all zenpacks in this process instead of running "
+        "zenpack --install for each one",
+    )
+    parser.add_argument(
+        "--commit-every",
+        type=int,
+        default=1,
+        help="with --batch, number of zenpacks to install per ZODB "
+        "commit, defaults to 1",
+    )
     parser.add_argument(
         "zp_blacklist",
         type=str,
@@ -72,4 +512,10 @@ if __name__ == "__main__":
         help="json file with list of zenpacks to exclude from the install",
     )
     args = parser.parse_args()
+    if args.index == "report" and not args.report:
+        parser.error("--index report needs --report")
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint")
+    if args.commit_every < 1:
+        parser.error("--commit-every must be at least 1")
     main(args)
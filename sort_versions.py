@@ -2,17 +2,36 @@
 import argparse
 import json
 
+import versions
+
+def pinnedVersion(versionInfo):
+    """The version an entry is pinned to, or None"""
+    if "version" in versionInfo:
+        return versionInfo["version"]
+    requirement = versionInfo.get("requirement", "")
+    if "===" in requirement:
+        return requirement.split("===")[1]
+    if "==" in requirement and "," not in requirement:
+        return requirement.split("==")[1]
+    return None
+
 def main(args):
-    versions = json.load(args.zp_versions)
+    versionList = json.load(args.zp_versions)
     args.zp_versions.close()
     def zpName(versionInfo):
         return versionInfo["name"]
-    print json.dumps(sorted(versions, key=zpName), indent=4, sort_keys=True, separators=(',', ': '))
+    def zpVersion(versionInfo):
+        version = pinnedVersion(versionInfo)
+        return version is None, versions.sortKey(version), versionInfo["name"]
+    key = zpVersion if args.key == "version" else zpName
+    print json.dumps(sorted(versionList, key=key), indent=4, sort_keys=True, separators=(',', ': '))
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Sort zenpack version json')
     parser.add_argument('zp_versions', type=file, nargs="?", default="zenpack_versions.json",
                         help='json file with list of zenpacks')
+    parser.add_argument('-k', '--key', choices=['name', 'version'], default='name',
+                        help='sort by name (default), or by pinned version with unpinned entries last')
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,166 @@
+import BaseHTTPServer
+import json
+import os
+import re
+import shutil
+import SocketServer
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import artifact_download
+import http_session
+
+
+class RangeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves server.content, honouring Range like a plain file server."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        content = self.server.content
+        self.server.requests.append(self.headers.get("Range"))
+        start = 0
+        match = re.match(r"bytes=(\d+)-$", self.headers.get("Range") or "")
+        if match:
+            start = int(match.group(1))
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */%d" % len(content))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, len(content) - 1, len(content)))
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(content) - start))
+        self.end_headers()
+        self.wfile.write(content[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class ServerTest(unittest.TestCase):
+    """Runs each test against a local server and in a scratch directory."""
+
+    def setUp(self):
+        self.server = Server(("127.0.0.1", 0), RangeHandler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.baseURL = "http://127.0.0.1:%d" % self.server.server_port
+        self.outdir = tempfile.mkdtemp()
+        self.session = artifact_download.httpSession
+        artifact_download.httpSession = http_session.Session(retries=0)
+
+    def tearDown(self):
+        artifact_download.httpSession = self.session
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.outdir)
+
+
+class ResumeTest(ServerTest):
+
+    def setUp(self):
+        super(ResumeTest, self).setUp()
+        self.url = self.baseURL + "/artifact.tar.gz"
+        self.path = os.path.join(self.outdir, "artifact.tar.gz")
+
+    def leavePartial(self, content, progress):
+        partPath, progressPath = artifact_download.partialPaths(self.path)
+        with open(partPath, "wb") as f:
+            f.write(content)
+        progress.update(url=self.url, etag=None, last_modified=None)
+        with open(progressPath, "w") as f:
+            json.dump(progress, f)
+
+    def assertDownloaded(self, content):
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), content)
+        for partialPath in artifact_download.partialPaths(self.path):
+            self.assertFalse(os.path.exists(partialPath))
+
+    def fetch(self):
+        artifact_download.fetchArtifact(self.url, self.path, None, None)
+
+    def testResume(self):
+        self.server.content = "0123456789"
+        self.leavePartial("01234", {"offset": 5, "length": 10})
+        self.fetch()
+        self.assertDownloaded("0123456789")
+        self.assertEqual(self.server.requests, ["bytes=5-"])
+
+    def testCompletePartialStartsOver(self):
+        self.server.content = "0123456789"
+        self.leavePartial("0123456789", {"offset": 10, "length": 10})
+        self.fetch()
+        self.assertDownloaded("0123456789")
+        self.assertEqual(self.server.requests, ["bytes=10-", None])
+        # A second run finds nothing left over to resume.
+        os.remove(self.path)
+        self.fetch()
+        self.assertDownloaded("0123456789")
+
+    def testSizeChangeWithoutETagStartsOver(self):
+        self.server.content = "abcdefghijklmnop"
+        self.leavePartial("01234", {"offset": 5, "length": 10})
+        self.fetch()
+        self.assertDownloaded("abcdefghijklmnop")
+        self.assertEqual(self.server.requests, ["bytes=5-", None])
+
+
+class ResolverTest(ServerTest):
+
+    def setUp(self):
+        super(ResolverTest, self).setUp()
+        self.server.content = json.dumps({"url": "http://zenpacks/ZenPacks.zenoss.Example-1.0.0-py2.7.egg"})
+
+    def resolve(self, requirement, ttl=3600):
+        resolver = artifact_download.ZenPackResolver(self.outdir, ttl)
+        resolver.endpoint = self.baseURL + "/requirement"
+        info = {"name": "ZenPacks.zenoss.Example", "type": "zenpack", "requirement": requirement}
+        url, cacheable = resolver.query(info)
+        resolver.resolve(url, cacheable)
+        return resolver._cachePath(url)
+
+    def expire(self, path):
+        old = time.time() - 7200
+        os.utime(path, (old, old))
+
+    def testEqualIsReusedWithinTTL(self):
+        self.resolve("ZenPacks.zenoss.Example==1.0.0")
+        self.resolve("ZenPacks.zenoss.Example==1.0.0")
+        self.assertEqual(len(self.server.requests), 1)
+
+    def testEqualIsFetchedAgainOnceExpired(self):
+        path = self.resolve("ZenPacks.zenoss.Example==1.0.0")
+        self.expire(path)
+        self.resolve("ZenPacks.zenoss.Example==1.0.0")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def testExactNeverExpires(self):
+        path = self.resolve("ZenPacks.zenoss.Example===1.0.0")
+        self.expire(path)
+        self.resolve("ZenPacks.zenoss.Example===1.0.0")
+        self.assertEqual(len(self.server.requests), 1)
+
+    def testRangeIsNotCached(self):
+        self.resolve("ZenPacks.zenoss.Example>=1.0.0")
+        self.resolve("ZenPacks.zenoss.Example>=1.0.0")
+        self.assertEqual(len(self.server.requests), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,11 @@ include ../versions.mk
 MATURITY     ?= DEV
 BUILD_NUMBER ?= DEV
 
+# Set ARTIFACT_CACHE_DIR to share downloaded artifacts between builds.
+ifneq ($(ARTIFACT_CACHE_DIR),)
+ARTIFACT_CACHE_OPTION = --cache-dir $(ARTIFACT_CACHE_DIR)
+endif
+
 ifeq ($(TARGET_PRODUCT),)
 PRODUCT = $(notdir $(shell pwd))
 else
@@ -0,0 +1,204 @@
+#!/usr/bin/env python2.7
+
+"""Version parsing shared by the product-assembly tools.
+
+Artifact logs, version manifests and pip listings hold version strings
+such as "1.10.0", "2.0.0rc1", "1.2.0-SNAPSHOT" or "3.1.0.dev5+gabc123",
+next to git refs like "develop" that are not versions at all.  Comparing
+them as strings puts "1.10.0" before "1.9.0", so parseVersion() turns
+them into Version objects ordered by PEP 440 rules, and classifyChange()
+names the kind of change between two of them.
+
+Parsed versions are cached, since the same strings recur across every
+build and artifact compared.
+"""
+
+import functools
+import re
+
+_VERSION_RE = re.compile(r"""
+    ^\s*v?
+    (?:(?P<epoch>\d+)!)?
+    (?P<release>\d+(?:\.\d+)*)
+    (?:[-_.]?(?P<pre_l>alpha|beta|preview|pre|rc|a|b|c)[-_.]?(?P<pre_n>\d+)?)?
+    (?:-(?P<post_n1>\d+)|[-_.]?(?P<post_l>post|rev|r)[-_.]?(?P<post_n2>\d+)?)?
+    (?:[-_.]?(?P<dev_l>dev|snapshot)[-_.]?(?P<dev_n>\d+)?)?
+    (?:\+(?P<local>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?
+    \s*$
+    """, re.VERBOSE | re.IGNORECASE)
+
+_PRE_RELEASE_NAMES = {
+    "alpha": "a", "a": "a",
+    "beta": "b", "b": "b",
+    "c": "rc", "rc": "rc", "pre": "rc", "preview": "rc",
+}
+
+# Kinds of change returned by classifyChange(), riskiest first.
+CHANGE_KINDS = (
+    "downgrade",
+    "major",
+    "pre-release",
+    "other",
+    "minor",
+    "patch",
+    "added",
+    "removed",
+    "same",
+)
+
+
+@functools.total_ordering
+class Version(object):
+    """A parsed version, ordered like PEP 440 versions.
+
+    Pre-releases sort before their release, dev releases before their
+    pre-releases and post releases after the release; a local version
+    ("+...") sorts after the same version without one.
+    """
+
+    def __init__(self, text, epoch, release, pre, post, dev, local):
+        self.text = text
+        self.epoch = epoch
+        self.release = release
+        self.pre = pre
+        self.post = post
+        self.dev = dev
+        self.local = local
+        self._key = self._sortKey()
+
+    def _sortKey(self):
+        release = list(self.release)
+        while len(release) > 1 and release[-1] == 0:
+            release.pop()
+        if self.pre is not None:
+            pre = (1,) + self.pre
+        elif self.dev is not None and self.post is None:
+            pre = (0,)
+        else:
+            pre = (2,)
+        post = (0,) if self.post is None else (1, self.post)
+        dev = (1,) if self.dev is None else (0, self.dev)
+        local = () if self.local is None else tuple(
+            (1, int(part), "") if part.isdigit() else (0, 0, part)
+            for part in re.split(r"[-_.]", self.local.lower())
+        )
+        return self.epoch, tuple(release), pre, post, dev, local
+
+    def _part(self, index):
+        return self.release[index] if index < len(self.release) else 0
+
+    @property
+    def major(self):
+        return self._part(0)
+
+    @property
+    def minor(self):
+        return self._part(1)
+
+    @property
+    def micro(self):
+        return self._part(2)
+
+    @property
+    def isPrerelease(self):
+        """True for pre-releases, dev releases and local builds."""
+        return self.pre is not None or self.dev is not None or self.local is not None
+
+    def __eq__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key == other._key
+
+    def __ne__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key != other._key
+
+    def __lt__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key < other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __repr__(self):
+        return "Version(%r)" % self.text
+
+    def __str__(self):
+        return self.text
+
+
+_parsed = {}
+
+
+def parseVersion(text):
+    """Return the Version of text, or None if text is not a version."""
+    try:
+        return _parsed[text]
+    except KeyError:
+        pass
+    version = None
+    match = _VERSION_RE.match(text) if text else None
+    if match:
+        pre = None
+        if match.group("pre_l"):
+            pre = (_PRE_RELEASE_NAMES[match.group("pre_l").lower()], int(match.group("pre_n") or 0))
+        post = None
+        if match.group("post_n1"):
+            post = int(match.group("post_n1"))
+        elif match.group("post_l"):
+            post = int(match.group("post_n2") or 0)
+        dev = None
+        if match.group("dev_l"):
+            dev = int(match.group("dev_n") or 0)
+        version = Version(
+            text,
+            int(match.group("epoch") or 0),
+            tuple(int(part) for part in match.group("release").split(".")),
+            pre, post, dev, match.group("local"))
+    _parsed[text] = version
+    return version
+
+
+def sortKey(text):
+    """Sort key that orders versions by value, after anything missing and
+    before anything that is not a version, such as a branch name."""
+    if text is None:
+        return (0, None)
+    version = parseVersion(text)
+    if version is None:
+        return (2, text)
+    return (1, version)
+
+
+def classifyChange(old, new):
+    """Return the kind of change, one of CHANGE_KINDS, from old to new.
+
+    Either may be None for an artifact that was added or removed.  A
+    change to or from something that is not a version, or between two
+    spellings of the same version, is "other".
+    """
+    if old == new:
+        return "same"
+    if old is None:
+        return "added"
+    if new is None:
+        return "removed"
+    oldVersion, newVersion = parseVersion(old), parseVersion(new)
+    if oldVersion is None or newVersion is None or oldVersion == newVersion:
+        return "other"
+    if newVersion < oldVersion:
+        return "downgrade"
+    if newVersion.isPrerelease:
+        return "pre-release"
+    if (newVersion.epoch, newVersion.major) != (oldVersion.epoch, oldVersion.major):
+        return "major"
+    if newVersion.minor != oldVersion.minor:
+        return "minor"
+    return "patch"
+
+
+def changeRisk(kind):
+    """Sort key that puts the riskiest kinds of change first."""
+    return CHANGE_KINDS.index(kind)